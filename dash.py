@@ -1,7 +1,14 @@
 import streamlit as st
+import pandas as pd
 import yaml
 from pathlib import Path
 from streamlit_option_menu import option_menu
+
+# I dataset sono condivisi tra tutte le sessioni e restituiti come viste (copy(deep=False)):
+# con copy-on-write ogni modifica fatta da una tab crea una copia locale
+# senza alterare il frame condiviso. Impostato qui, prima di importare le tab.
+pd.set_option("mode.copy_on_write", True)
+
 from tabs import metrics, recurrence_analysis, map_h3, map_choropleth
 
 # ===================== Config =====================
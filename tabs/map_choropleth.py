@@ -9,6 +9,7 @@ import streamlit.components.v1 as components
 from dotenv import load_dotenv
 from utils.utilities import fmt
 from utils.persistence import list_available_cities, load_geojson, load_csv_city
+from utils.schema import genere_category
 
 # ===================== Logging setup =====================
 logging.basicConfig(
@@ -282,19 +283,19 @@ def render(allowed_regions=None):
                                          default=available_genres,
                                          key="filter_genres_priority")
 
-        df_city["GENERE_DISPLAY"] = df_city["locale_genere"].apply(
-            lambda g: g if g in GENERI_PRIORITARI else "Altro"
-        )
+        df_city["GENERE_DISPLAY"] = genere_category(df_city["locale_genere"], GENERI_PRIORITARI)
         df_filtered = df_city[df_city["GENERE_DISPLAY"].isin(selected_genres)]
 
         # --- Filtro locale ---
         highlight_locale = None
         if not df_filtered.empty:
-            available_locals = ["Tutti"] + sorted(df_filtered["des_locale"].unique().tolist())
-            selected_local = st.selectbox("Seleziona locale:", available_locals, index=0, key="filter_local_priority")
+            locali_labels = dict(zip(df_filtered["venue_id"].tolist(), df_filtered["des_locale"].astype(str).tolist()))
+            available_locals = ["Tutti"] + sorted(locali_labels, key=locali_labels.get)
+            selected_local = st.selectbox("Seleziona locale:", available_locals, index=0, key="filter_local_priority",
+                                          format_func=lambda v: locali_labels.get(v, v))
 
             if selected_local != "Tutti":
-                df_display = df_filtered[df_filtered["des_locale"] == selected_local]
+                df_display = df_filtered[df_filtered["venue_id"] == selected_local]
                 if not df_display.empty:
                     st.session_state.map_center = (
                         float(df_display["latitudine"].iloc[0]),
@@ -302,7 +303,7 @@ def render(allowed_regions=None):
                     )
                     st.session_state.map_zoom = zoom_l
                     df_filtered = df_display
-                    highlight_locale = selected_local
+                    highlight_locale = locali_labels[selected_local]
         else:
             selected_local = "Tutti"
 
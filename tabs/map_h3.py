@@ -6,6 +6,7 @@ import streamlit.components.v1 as components
 import plotly.express as px
 from utils.persistence import load_csv_city, list_available_cities, load_geojson
 from utils.utilities import fmt
+from utils.schema import genere_category
 from dotenv import load_dotenv
 
 # ===================== Config logging =====================
@@ -163,9 +164,10 @@ def render(allowed_regions=None):
         default_idx = available_sedi.index("Roma") if "Roma" in available_sedi else 0
         selected_sede = st.selectbox("Seleziona sede:", available_sedi, index=default_idx, key="filter_sede")
 
-        df_base = load_csv_city(selected_sede).copy()
-        df_base["GENERE_NORM"] = df_base["locale_genere"].apply(lambda g: g if g in GENERI_PRIORITARI else "Altro")
-        df_filtered = df_base.copy()
+        # Vista sul frame condiviso: la colonna aggiunta resta locale (copy-on-write)
+        df_base = load_csv_city(selected_sede)
+        df_base["GENERE_NORM"] = genere_category(df_base["locale_genere"], GENERI_PRIORITARI)
+        df_filtered = df_base
 
         if st.session_state.get("last_sede") != selected_sede:
             st.session_state["filter_my_cod"] = "Tutti"
@@ -192,12 +194,14 @@ def render(allowed_regions=None):
             df_filtered = df_filtered[df_filtered["GENERE_NORM"].isin(selected_genres)]
 
         # --- Filtro locale ---
-        available_locals = ["Tutti"] + sorted(df_filtered["des_locale"].unique().tolist())
-        selected_local = st.selectbox("Seleziona locale:", available_locals, index=0, key="filter_local")
+        locali_labels = dict(zip(df_filtered["venue_id"].tolist(), df_filtered["des_locale"].astype(str).tolist()))
+        available_locals = ["Tutti"] + sorted(locali_labels, key=locali_labels.get)
+        selected_local = st.selectbox("Seleziona locale:", available_locals, index=0, key="filter_local",
+                                      format_func=lambda v: locali_labels.get(v, v))
         highlight_locale = None
         if selected_local != "Tutti":
-            df_filtered = df_filtered[df_filtered["des_locale"] == selected_local]
-            highlight_locale = selected_local
+            df_filtered = df_filtered[df_filtered["venue_id"] == selected_local]
+            highlight_locale = locali_labels[selected_local]
 
     # ======= MAPPA =======
     with col_map:
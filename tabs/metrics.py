@@ -5,7 +5,11 @@ import os
 import logging
 from logging.handlers import RotatingFileHandler
 from utils.persistence import load_csv_city
-from utils.utilities import create_events_timeline_chart, get_today_events, extract_links
+from utils.schema import concat_frames, genere_category
+from utils.deep_search import circuit_stats
+from utils.search_jobs import ACTIVE, CANCELLED, DONE, cancel_job, job_results, job_status
+from utils.utilities import (create_events_timeline_chart, extract_links, job_events_by_day, job_owner,
+                             latest_active_events_job, start_search_workers, submit_events_job)
 from dotenv import load_dotenv
 import re
 
@@ -38,8 +42,139 @@ GENERI_PRIORITARI = [g.strip() for g in gen_prioritari_str.split(",") if g.strip
 
 logger.info("Avvio modulo metrics. Generi prioritari: %s", GENERI_PRIORITARI)
 
+# Ogni quanti secondi la pagina rilegge l'avanzamento di una ricerca in background
+JOB_POLL_SECONDS = float(os.getenv("EVENTS_JOB_POLL_SECONDS", "2"))
+
+SERVICE_NAMES = {"serper": "ricerca web (Serper)", "gemini": "verifica (Gemini)"}
+
+
+def _render_backend_status():
+    """Avviso per i servizi della deep search con circuito aperto o in prova"""
+    for name, stats in circuit_stats().items():
+        if stats["state"] == "open":
+            logger.warning(f"Circuito {name} aperto: {stats}")
+            st.warning(
+                f"⚠️ Servizio di {SERVICE_NAMES.get(name, name)} non disponibile: le verifiche "
+                f"falliscono subito senza essere salvate. Nuovo tentativo tra {stats['retry_in']:.0f}s."
+            )
+        elif stats["state"] == "half_open":
+            st.info(f"Servizio di {SERVICE_NAMES.get(name, name)} in verifica dopo un'interruzione.")
+
+
+def _render_day_cards(df_day):
+    """Card dei locali con evento (link ed evidenze) nel riquadro di un giorno"""
+    if df_day is None or df_day.empty:
+        return
+    for _, row in df_day.iterrows():
+        if not (row['Link'] and row['Link'].strip() != "-"):
+            continue
+        links = extract_links(row['Link'])
+
+        # Rendering card con i link dentro
+        st.markdown(
+            f"""
+            <div class="venue-card">
+              <div class="venue-head">
+                <div class="venue-name">{row['Nome Locale']}</div>
+              </div>
+              <div class="links-wrap">
+                {''.join([f"<a href='{l.strip()}' target='_blank' class='chip-link'>Link {i + 1}</a>" for i, l in enumerate(links)])}
+              </div>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
+        evidenze_meta = row.get('EVIDENZE_META') if isinstance(row, pd.Series) else None
+        if evidenze_meta:
+            for ev in evidenze_meta:
+                title = ev.get('title') or 'Evento trovato'
+                url = ev.get('url') or ''
+                snippet = ev.get('snippet') or ''
+                time_info = ev.get('time') or ''
+                domain = re.sub(r"^https?://", "", url).split("/")[0] if url else ''
+                st.markdown(
+                    f"""
+                    <div class="compact-card">
+                      <div class="header">
+                        <div class="title">{title}</div>
+                      </div>
+                      <div class="meta">
+                        <span class="badge badge-ev">Evidenza</span>
+                        <span class="domain">{domain}</span>
+                        <span class="time-dot"></span><span>{time_info}</span>
+                      </div>
+                      <p class="snippet">{snippet}</p>
+                      <div class="actions"><a class="link-btn" href="{url}" target="_blank">Link</a></div>
+                    </div>
+                    """,
+                    unsafe_allow_html=True
+                )
+
+
+def _render_events_job(job_id):
+    """
+    Avanzamento e risultati parziali di una ricerca in background: finché il job è attivo
+    il riquadro si aggiorna da solo ogni JOB_POLL_SECONDS senza rieseguire la pagina.
+    """
+    job = job_status(job_id)
+    if job is None or job["owner"] != job_owner():
+        # Job inesistente o di un altro utente (link ?job= condiviso): non si mostra
+        st.session_state.pop("events_job_id", None)
+        if st.query_params.get("job") == job_id:
+            del st.query_params["job"]
+        return
+    active = job["status"] in ACTIVE
+
+    @st.fragment(run_every=JOB_POLL_SECONDS if active else None)
+    def show():
+        job = job_status(job_id)
+        if job is None:
+            return
+        if active and job["status"] not in ACTIVE:
+            # Job concluso: un ultimo rendering completo, senza più aggiornamenti periodici
+            st.rerun()
+
+        results = job_results(job_id)
+        events_by_day = job_events_by_day(job, results)
+        st.session_state.df_events_by_day = events_by_day
+
+        if job["status"] in ACTIVE:
+            progress = job["done"] / job["total"] if job["total"] else 0.0
+            st.progress(progress, text=f"Ricerca in corso: verificati {job['done']} di {job['total']} (locale, giorno)")
+            if st.button("Annulla ricerca", key=f"cancel_job_{job_id}"):
+                cancel_job(job_id)
+                logger.info(f"Ricerca {job_id} annullata")
+                st.rerun()
+        elif job["status"] == CANCELLED:
+            st.info(f"Ricerca annullata: verificati {job['done']} di {job['total']} (locale, giorno).")
+
+        # --- riquadri dei giorni con layout a 3 colonne ---
+        for i, day_str in enumerate(job["days"]):
+            # nuova riga ogni 3 giorni
+            if i % 3 == 0:
+                cols = st.columns(3)
+
+            with cols[i % 3]:
+                st.markdown(f"<div class='day-wrap'><div class='day-title'>{day_str}</div></div>",
+                            unsafe_allow_html=True)
+                _render_day_cards(events_by_day[day_str])
+
+        if job["status"] == DONE:
+            # Il CSV con tutti i risultati è scritto dal worker a fine ricerca (meta del job)
+            export = job["meta"].get("export")
+            if export:
+                st.success(f"Ricerca completata! Trovati {export['rows']} eventi. CSV salvato in: {export['path']}")
+            else:
+                st.info("Ricerca completata. Nessun evento con link trovato.")
+
+    show()
+
 
 def render(allowed_regions=None):
+    # Worker delle ricerche in background attivi dal primo rendering: riprendono i job
+    # rimasti in coda anche prima di una nuova ricerca
+    start_search_workers()
     st.header("Locali ad alta priorità")
 
     # Inizializza set dei locali nascosti e tracciamento ultimo click
@@ -78,7 +213,7 @@ def render(allowed_regions=None):
             st.error("Nessun dato disponibile per le regioni assegnate.")
             return
 
-        df = pd.concat(df_cities, ignore_index=True)
+        df = concat_frames(df_cities)
 
     if df.empty:
         logger.error("Dati non caricati o DataFrame vuoto.")
@@ -118,7 +253,7 @@ def render(allowed_regions=None):
                 logger.info("Comuni selezionati: %s", selected_comuni)
 
                 if 'locale_genere' in df.columns:
-                    df['GENERE_CAT'] = df['locale_genere'].apply(lambda g: g if g in GENERI_PRIORITARI else "Altro")
+                    df['GENERE_CAT'] = genere_category(df['locale_genere'], GENERI_PRIORITARI)
                     default_genres = [v for v in GENERI_PRIORITARI if v != 'Altro'][:3]
                     selected_genres = st.multiselect("Generi:", options=df['GENERE_CAT'].unique(),
                                                          default=default_genres, key="metrics_genres_tab")
@@ -131,8 +266,12 @@ def render(allowed_regions=None):
                     df['seprag_cod'].isin(selected_comuni) if selected_comuni else True)]
                 if selected_genres:
                     df_for_locals = df_for_locals[df_for_locals['GENERE_CAT'].isin(selected_genres)]
-                locali_options = sorted(df_for_locals['des_locale'].dropna().unique().tolist())
-                selected_locali = st.multiselect("Seleziona locale (opzionale)", options=locali_options, default=[],
+                df_locals_options = df_for_locals[df_for_locals['venue_id'] >= 0].drop_duplicates('venue_id')
+                locali_labels = dict(zip(df_locals_options['venue_id'].tolist(),
+                                         df_locals_options['des_locale'].astype(str).tolist()))
+                selected_locali = st.multiselect("Seleziona locale (opzionale)",
+                                                     options=sorted(locali_labels, key=locali_labels.get),
+                                                     format_func=locali_labels.get, default=[],
                                                      key="metrics_locali_tab")
                 logger.info("Locali selezionati: %s", selected_locali)
 
@@ -155,7 +294,7 @@ def render(allowed_regions=None):
                 return
 
             if selected_locali:
-                df = df[df['des_locale'].isin(selected_locali)]
+                df = df[df['venue_id'].isin(selected_locali)]
 
         except Exception as e:
             logger.exception("Errore durante l'applicazione dei filtri: %s", str(e))
@@ -188,7 +327,7 @@ def render(allowed_regions=None):
 
         # Filtra locali nascosti
         if st.session_state.hidden_locales:
-            df = df[~df['des_locale'].isin(st.session_state.hidden_locales)]
+            df = df[~df['venue_id'].isin(st.session_state.hidden_locales)]
             logger.info(f"Filtrati {len(st.session_state.hidden_locales)} locali nascosti")
 
         if 'priority_score' in df.columns:
@@ -246,10 +385,10 @@ def render(allowed_regions=None):
         checked_rows = edited_df[edited_df["❌"] == True]
         if not checked_rows.empty:
             for idx in checked_rows.index:
-                locale_to_hide = checked_rows.loc[idx, "Nome Locale"]
+                locale_to_hide = int(df_top.loc[idx, "venue_id"])
                 if locale_to_hide not in st.session_state.hidden_locales:
                     st.session_state.hidden_locales.add(locale_to_hide)
-                    logger.info(f"Locale nascosto: {locale_to_hide}")
+                    logger.info(f"Locale nascosto: {checked_rows.loc[idx, 'Nome Locale']} (venue_id {locale_to_hide})")
             st.rerun()
 
     # ----------------- Eventi per date selezionate -----------------
@@ -501,141 +640,47 @@ def render(allowed_regions=None):
         logger.info("Ricerca abilitata")
         search_disabled = False
 
+    _render_backend_status()
+
     if st.button("Cerca eventi per le date selezionate", key="search_selected_days_events",
                          disabled=search_disabled):
 
         logger.info("Bottone 'Cerca eventi' premuto")
         logger.info(f"search_disabled={search_disabled}, date_selection={date_selection}")
 
-        with st.spinner("Ricerca eventi in corso..."):
-            st.session_state.df_events_by_day = {}
-            selected_dates = []
-
-            if isinstance(date_selection, tuple) and len(date_selection) == 2:
-                start_date, end_date = date_selection
-                logger.info(f"Intervallo selezionato: start_date={start_date}, end_date={end_date}")
-                if start_date and end_date and start_date <= end_date:
-                    delta_days = (end_date - start_date).days
-                    logger.info(f"Delta giorni: {delta_days}")
-                    selected_dates = [start_date + datetime.timedelta(days=i) for i in range(delta_days + 1)]
-                else:
-                    logger.warning("Intervallo date non valido, uso today_dt")
-                    selected_dates = [today_dt]
-            elif hasattr(date_selection, "strftime"):
-                logger.info(f"Singola data selezionata: {date_selection}")
-                selected_dates = [date_selection]
-            else:
-                logger.warning("Formato date_selection inatteso, uso today_dt")
-                selected_dates = [today_dt]
+        selected_dates = []
 
-            logger.info(f"Date selezionate per ricerca: {selected_dates}")
-
-            # Lista per raccogliere tutti i risultati per CSV
-            csv_results = []
-
-            # --- ciclo sui giorni con layout a 3 colonne ---
-            for i, d in enumerate(selected_dates):
-                day_str = f"{d.day:02d} {mesi[d.month]} {d.year}"
-                logger.info(f"Ricerca eventi per giorno: {day_str}")
-                df_day = get_today_events(df_top, day_str)
-                st.session_state.df_events_by_day[day_str] = df_day
-
-                # nuova riga ogni 3 giorni
-                if i % 3 == 0:
-                    cols = st.columns(3)
-
-                with cols[i % 3]:
-                    st.markdown(f"<div class='day-wrap'><div class='day-title'>{day_str}</div></div>",
-                                unsafe_allow_html=True)
-
-                    if df_day is not None and not df_day.empty:
-                        logger.info(f"Trovati {len(df_day)} eventi per {day_str}")
-                        for _, row in df_day.iterrows():
-                            has_links = row['Link'] and row['Link'].strip() != "-"
-                            logger.info(f"Locale: {row['Nome Locale']}, has_links={has_links}")
-
-                            # Trova l'indirizzo del locale nel df_top
-                            locale_info = df_top[df_top['des_locale'] == row['Nome Locale']]
-                            indirizzo = locale_info.iloc[0]['indirizzo'] if not locale_info.empty and 'indirizzo' in locale_info.columns else 'N/A'
-
-                            if has_links:
-                                links = extract_links(row['Link'])
-
-                                # Aggiungi ai risultati CSV
-                                for link in links:
-                                    csv_results.append({
-                                        'locale': row['Nome Locale'],
-                                        'data_evento': d.strftime('%d/%m/%Y'),
-                                        'link_evento': link.strip(),
-                                        'indirizzo': indirizzo
-                                    })
-
-                                # Rendering card con i link dentro
-                                st.markdown(
-                                    f"""
-                                    <div class="venue-card">
-                                      <div class="venue-head">
-                                        <div class="venue-name">{row['Nome Locale']}</div>
-                                      </div>
-                                      <div class="links-wrap">
-                                        {''.join([f"<a href='{l.strip()}' target='_blank' class='chip-link'>Link {i + 1}</a>" for i, l in enumerate(links)])}
-                                      </div>
-                                    </div>
-                                    """,
-                                    unsafe_allow_html=True
-                                )
-
-                                evidenze_meta = row.get('EVIDENZE_META') if isinstance(row, pd.Series) else None
-                                if evidenze_meta:
-                                    for ev in evidenze_meta:
-                                        title = ev.get('title') or 'Evento trovato'
-                                        url = ev.get('url') or ''
-                                        snippet = ev.get('snippet') or ''
-                                        time_info = ev.get('time') or ''
-                                        domain = re.sub(r"^https?://", "", url).split("/")[0] if url else ''
-                                        st.markdown(
-                                            f"""
-                                            <div class="compact-card">
-                                              <div class="header">
-                                                <div class="title">{title}</div>
-                                              </div>
-                                              <div class="meta">
-                                                <span class="badge badge-ev">Evidenza</span>
-                                                <span class="domain">{domain}</span>
-                                                <span class="time-dot"></span><span>{time_info}</span>
-                                              </div>
-                                              <p class="snippet">{snippet}</p>
-                                              <div class="actions"><a class="link-btn" href="{url}" target="_blank">Link</a></div>
-                                            </div>
-                                            """,
-                                            unsafe_allow_html=True
-                                        )
-
-            # Salva CSV con tutti i risultati alla fine della ricerca
-            if csv_results:
-                # Costruisci nome file con filtri applicati
-                date_range = f"{selected_dates[0].strftime('%Y%m%d')}-{selected_dates[-1].strftime('%Y%m%d')}" if len(selected_dates) > 1 else selected_dates[0].strftime('%Y%m%d')
-
-                # Formatta generi (max 3, sostituisce spazi e caratteri speciali)
-                def sanitize_filename(s):
-                    """Rimuove caratteri non validi per nomi file"""
-                    return re.sub(r'[^\w\s-]', '', s).replace(' ', '_')
-
-                generi_str = "_".join([sanitize_filename(g) for g in selected_genres[:3]]) if selected_genres else "tutti"
-
-                # Formatta seprag (max 3, converti in stringa)
-                seprag_str = "_".join([str(c) for c in selected_comuni[:3]]) if selected_comuni else "tutti"
-
-                csv_filename = f"data/export/eventi_trovati_{date_range}_{generi_str}_{seprag_str}.csv"
-
-                # Crea directory se non esiste
-                os.makedirs("data/export", exist_ok=True)
-
-                df_export = pd.DataFrame(csv_results)
-                df_export.to_csv(csv_filename, index=False, encoding='utf-8-sig')
-
-                logger.info(f"CSV esportato: {csv_filename} con {len(csv_results)} risultati")
-                st.success(f"Ricerca completata! Trovati {len(csv_results)} eventi. CSV salvato in: {csv_filename}")
+        if isinstance(date_selection, tuple) and len(date_selection) == 2:
+            start_date, end_date = date_selection
+            logger.info(f"Intervallo selezionato: start_date={start_date}, end_date={end_date}")
+            if start_date and end_date and start_date <= end_date:
+                delta_days = (end_date - start_date).days
+                logger.info(f"Delta giorni: {delta_days}")
+                selected_dates = [start_date + datetime.timedelta(days=i) for i in range(delta_days + 1)]
             else:
-                logger.info("Nessun evento con link trovato per l'export CSV")
-                st.info("Ricerca completata. Nessun evento con link trovato.")
\ No newline at end of file
+                logger.warning("Intervallo date non valido, uso today_dt")
+                selected_dates = [today_dt]
+        elif hasattr(date_selection, "strftime"):
+            logger.info(f"Singola data selezionata: {date_selection}")
+            selected_dates = [date_selection]
+        else:
+            logger.warning("Formato date_selection inatteso, uso today_dt")
+            selected_dates = [today_dt]
+
+        logger.info(f"Date selezionate per ricerca: {selected_dates}")
+
+        # La ricerca gira in background nella coda persistente: rerun, disconnessioni e
+        # riavvii non la interrompono, la pagina ne mostra l'avanzamento
+        day_strs = [f"{d.day:02d} {mesi[d.month]} {d.year}" for d in selected_dates]
+        job_id = submit_events_job(df_top, day_strs, meta={
+            "dates": [d.isoformat() for d in selected_dates],
+            "generi": list(selected_genres or []),
+            "comuni": [str(c) for c in (selected_comuni or [])],
+        })
+        st.session_state.events_job_id = job_id
+        st.query_params["job"] = job_id
+
+    job_id = st.session_state.get("events_job_id") or st.query_params.get("job") or latest_active_events_job()
+    if job_id:
+        st.session_state.events_job_id = job_id
+        _render_events_job(job_id)
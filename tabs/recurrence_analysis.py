@@ -1,6 +1,7 @@
 import datetime
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 import logging
 from logging.handlers import RotatingFileHandler
@@ -8,6 +9,11 @@ from dotenv import load_dotenv
 import plotly.express as px
 import plotly.graph_objects as go
 from pathlib import Path
+from utils.schema import LOCALI_SCHEMA, apply_schema, concat_frames, genere_category
+from utils import events_store
+from utils.event_cube import day_counts, get_event_cube, mask_future
+from utils.recurrence_index import get_recurrence_index, popcount, reference_date, target_date
+from utils.venues import assign_venue_ids
 
 # ==========================
 # Config Logging
@@ -35,76 +41,35 @@ gen_prioritari_str = os.getenv("GENERI_PRIORITARI", "")
 GENERI_PRIORITARI = [g.strip() for g in gen_prioritari_str.split(",") if g.strip()]
 DATA_DIR = os.getenv("DATA_DIR", "data")
 LOCALI_CSV_DIR = os.getenv("LOCALI_CSV_DIR", DATA_DIR)
-EVENTI_CSV_DIR = os.getenv("EVENTI_CSV_DIR", DATA_DIR)
 
 logger.info("Avvio modulo recurrence_analysis. Generi prioritari: %s", GENERI_PRIORITARI)
-logger.info("DATA_DIR: %s, LOCALI_CSV_DIR: %s, EVENTI_CSV_DIR: %s", DATA_DIR, LOCALI_CSV_DIR, EVENTI_CSV_DIR)
+logger.info("DATA_DIR: %s, LOCALI_CSV_DIR: %s", DATA_DIR, LOCALI_CSV_DIR)
 
 
 def load_events_data(allowed_regions):
     """
-    Carica tutti i file Eventi_{città}_{anno}.csv disponibili per le regioni autorizzate.
-    Ritorna un DataFrame unificato con colonna 'anno' aggiunta.
+    Carica tutti gli eventi Eventi_{città}_{anno}.csv disponibili per le regioni autorizzate,
+    dallo store partizionato per sede/anno (vedi utils.events_store).
+    Ritorna un DataFrame unificato con colonne 'anno', 'giorno', 'mese', 'giorno_anno' e 'data'.
     """
     logger.info(f"Caricamento dati eventi per regioni: {allowed_regions}")
 
-    all_events = []
-    available_years = set()
-
-    for region in allowed_regions:
-        # Cerca tutti i file Eventi_{region}_{anno}.csv
-        pattern = f"Eventi_{region}_*.csv"
-        event_files = list(Path(EVENTI_CSV_DIR).glob(pattern))
-
-        logger.info(f"Trovati {len(event_files)} file eventi per {region}")
-
-        for file_path in event_files:
-            try:
-                # Estrai anno dal nome file
-                filename = file_path.stem  # Eventi_Roma_2025
-                parts = filename.split("_")
-                if len(parts) >= 3:
-                    year = int(parts[-1])
-                else:
-                    logger.warning(f"Impossibile estrarre anno da {filename}")
-                    continue
-
-                # Carica CSV
-                df = pd.read_csv(file_path)
-                df['anno'] = year
-                df['sede'] = region
-
-                # Parse data
-                if 'data_ora_inizio' in df.columns:
-                    df['data_ora_inizio'] = pd.to_datetime(df['data_ora_inizio'], errors='coerce')
-                    df['giorno'] = df['data_ora_inizio'].dt.day
-                    df['mese'] = df['data_ora_inizio'].dt.month
-                    df['data'] = df['data_ora_inizio'].dt.date
-
-                all_events.append(df)
-                available_years.add(year)
-
-                logger.info(f"Caricato {file_path.name}: {len(df)} eventi")
-
-            except Exception as e:
-                logger.error(f"Errore caricamento {file_path}: {e}")
-
-    if not all_events:
+    df_combined = events_store.load_events(allowed_regions)
+    if df_combined.empty:
         logger.warning("Nessun file eventi caricato")
         return pd.DataFrame(), []
 
-    df_combined = pd.concat(all_events, ignore_index=True)
-    available_years = sorted(list(available_years))
+    years = events_store.available_years(allowed_regions)
 
-    logger.info(f"Totale eventi caricati: {len(df_combined)}, anni disponibili: {available_years}")
+    logger.info(f"Totale eventi caricati: {len(df_combined)}, anni disponibili: {years}")
 
-    return df_combined, available_years
+    return df_combined, years
 
 
 def load_locali_priority_scores(allowed_regions):
     """
     Carica i file Locali_{città}.csv per ottenere i priority_score.
-    Ritorna un DataFrame con des_locale, sede, priority_score.
+    Ritorna un DataFrame con venue_id, des_locale, sede, priority_score.
     """
     logger.info(f"Caricamento priority scores per regioni: {allowed_regions}")
 
@@ -135,6 +100,7 @@ def load_locali_priority_scores(allowed_regions):
             # Seleziona solo le colonne necessarie
             df_subset = df[['des_locale', 'priority_score']].copy()
             df_subset['sede'] = region
+            df_subset = apply_schema(assign_venue_ids(df_subset), LOCALI_SCHEMA)
 
             all_locali.append(df_subset)
 
@@ -147,20 +113,139 @@ def load_locali_priority_scores(allowed_regions):
         logger.warning("Nessun file Locali caricato")
         return pd.DataFrame()
 
-    df_combined = pd.concat(all_locali, ignore_index=True)
+    df_combined = concat_frames(all_locali)
 
     # Rimuovi duplicati (in caso ci siano)
-    df_combined = df_combined.drop_duplicates(subset=['des_locale', 'sede'])
+    df_combined = df_combined.drop_duplicates(subset=['venue_id'])
 
     logger.info(f"Totale locali caricati: {len(df_combined)}")
 
     return df_combined
 
 
-def calculate_recurrence_score(df_events, df_priority_scores, day, month, filters):
+def _filter_groups(index, rows, filters):
+    """Maschera booleana dei gruppi dell'indice (righe rows) che soddisfano i filtri della tab"""
+    groups = index.groups.iloc[rows]
+    keep = np.ones(len(rows), dtype=bool)
+    if filters.get('sedi'):
+        keep &= groups['sede'].isin(filters['sedi']).to_numpy()
+    if filters.get('comuni'):
+        keep &= groups['seprag_cod'].isin(filters['comuni']).to_numpy()
+    if filters.get('generi'):
+        keep &= genere_category(groups['locale_genere'], GENERI_PRIORITARI).isin(filters['generi']).to_numpy()
+    if filters.get('locali'):
+        keep &= groups['venue_id'].isin(filters['locali']).to_numpy()
+    return keep
+
+
+def _anni_passati(day, month, available_years, oggi, riferimento=None):
+    """
+    Anni disponibili in cui il giorno/mese indicato è già passato rispetto a oggi.
+    Con riferimento si considera la data allineata al giorno della settimana di ogni anno.
+    """
+    if riferimento is not None:
+        return [y for y in available_years if target_date(y, month, day, riferimento) <= oggi]
+
+    anno_corrente = oggi.year
+
+    # Se la data selezionata è già passata quest'anno, includi l'anno corrente
+    data_selezionata_anno_corrente = datetime.date(anno_corrente, month,
+                                                   min(day, 28))  # min per evitare errori con febbraio
+    try:
+        data_selezionata_anno_corrente = datetime.date(anno_corrente, month, day)
+    except ValueError:
+        # Gestisce date invalide come 31 febbraio
+        pass
+
+    if data_selezionata_anno_corrente <= oggi:
+        return [y for y in available_years if y <= anno_corrente]
+    return [y for y in available_years if y < anno_corrente]
+
+
+def _cell_masks(cells):
+    """Maschera di bit degli anni obiettivo per ciascuna riga di celle (vedi RecurrenceIndex.window_cells)"""
+    bits = np.where(cells >= 0, np.left_shift(np.uint64(1), np.maximum(cells, 0).astype(np.uint64)), np.uint64(0))
+    return np.bitwise_or.reduce(bits, axis=1) if cells.shape[1] else np.zeros(len(cells), dtype=np.uint64)
+
+
+def _locali_positions(locali_venue_ids, group_venue_ids):
+    """Posizione in locali (-1 se assente) del locale di ciascun gruppo: join per ID intero"""
+    size = int(max(locali_venue_ids.max(initial=-1), group_venue_ids.max(initial=-1))) + 1
+    lookup = np.full(size + 1, -1, dtype=np.int64)  # l'ultima voce resta -1 per gli ID mancanti
+    lookup[locali_venue_ids[locali_venue_ids >= 0]] = np.flatnonzero(locali_venue_ids >= 0)
+    return lookup[np.where(group_venue_ids >= 0, group_venue_ids, size)]
+
+
+def _score_venues(index, group_rows, cells, df_filtered_locali, totale_anni_passati):
+    """
+    Score di ricorrenza di tutti i locali in un'unica passata sull'indice: join gruppi-locali
+    sull'ID intero del locale, OR delle maschere degli anni e popcount, senza iterare riga per riga.
+    cells indica per ogni gruppo e anno l'anno obiettivo a cui contano i suoi eventi (-1 = esclusi).
+    L'ordine delle righe segue quello di df_filtered_locali, come per il calcolo per locale.
+    """
+    locali = df_filtered_locali[['venue_id', 'des_locale', 'sede', 'priority_score']].reset_index(drop=True)
+
+    group_venue = _locali_positions(
+        locali['venue_id'].to_numpy(), index.groups['venue_id'].to_numpy()[group_rows]
+    )
+    matched_pos = np.flatnonzero(group_venue >= 0)
+    if not len(matched_pos):
+        return pd.DataFrame()
+
+    # Eventi delle celle in finestra, nell'ordine del frame eventi (primo evento = prima riga)
+    positions, slots, owner = index.group_events(group_rows[matched_pos])
+    target = cells[matched_pos[owner], slots]
+    in_window = target >= 0
+    venue = group_venue[matched_pos][owner][in_window]
+    positions, target = positions[in_window], target[in_window]
+    event_order = np.lexsort((positions, venue))
+    venue, positions, target = venue[event_order], positions[event_order], target[event_order]
+
+    venue_start = np.flatnonzero(np.r_[True, venue[1:] != venue[:-1]])
+    venue_size = np.diff(np.r_[venue_start, len(venue)])
+    venue_pos = venue[venue_start]
+
+    # Anni con evento: OR dei bit degli anni obiettivo degli eventi di ciascun locale
+    venue_masks = np.bitwise_or.reduceat(np.left_shift(np.uint64(1), target.astype(np.uint64)), venue_start)
+    num_anni = popcount(venue_masks)
+
+    first = index.events.iloc[positions[venue_start]].reset_index(drop=True)
+
+    if totale_anni_passati > 0:
+        score_ricorrenza = num_anni / totale_anni_passati
+    else:
+        score_ricorrenza = np.zeros(len(num_anni))
+    priority_score = locali['priority_score'].to_numpy()[venue_pos]
+
+    def first_or_nd(col):
+        return first[col] if col in first.columns else 'N/D'
+
+    return pd.DataFrame({
+        'venue_id': locali['venue_id'].to_numpy()[venue_pos],
+        'des_locale': locali['des_locale'].iloc[venue_pos].reset_index(drop=True),
+        'locale_genere': first_or_nd('locale_genere'),
+        'indirizzo': first_or_nd('indirizzo'),
+        'sede': locali['sede'].iloc[venue_pos].reset_index(drop=True),
+        'seprag_cod': first_or_nd('seprag_cod'),
+        'comune': first_or_nd('comune'),
+        'score_ricorrenza': score_ricorrenza,
+        'priority_score': priority_score,
+        'score': score_ricorrenza * priority_score,
+        'anni_con_evento': [index.mask_years(m) for m in venue_masks],
+        'totale_anni': totale_anni_passati,
+        'num_eventi_totali': venue_size,
+    })
+
+
+def calculate_recurrence_score(index, df_priority_scores, day, month, filters, window=0, weekday_aligned=False):
     """
     Calcola il punteggio di ricorrenza per ogni locale dal file Locali_{città}.csv
-    che ha eventi nel giorno/mese selezionato.
+    che ha eventi nel giorno/mese selezionato, usando l'indice delle ricorrenze
+    (utils.recurrence_index) invece di filtrare gli eventi.
+
+    Con window > 0 conta anche gli eventi entro ±window giorni dalla data; con
+    weekday_aligned la data di ogni anno è lo stesso "n-esimo giorno della settimana"
+    del mese (es. il primo sabato) invece dello stesso giorno/mese.
 
     IMPORTANTE: Considera SOLO eventi passati (data <= oggi)
 
@@ -172,8 +257,10 @@ def calculate_recurrence_score(df_events, df_priority_scores, day, month, filter
     Ritorna DataFrame con colonne:
     - des_locale, locale_genere, indirizzo, sede, seprag_cod
     - score_ricorrenza, priority_score, score (finale)
-    - anni_con_evento, totale_anni
-    - eventi_dettaglio (lista di eventi)
+    - anni_con_evento, totale_anni, num_eventi_totali
+
+    I dettagli degli eventi non fanno parte del risultato: si leggono su richiesta
+    per il solo locale selezionato con load_event_details.
     """
     logger.info(f"Calcolo score ricorrenza per {day:02d}/{month:02d}")
 
@@ -184,46 +271,24 @@ def calculate_recurrence_score(df_events, df_priority_scores, day, month, filter
     # Data odierna
     oggi = datetime.datetime.now().date()
 
-    # Filtra eventi per il giorno/mese selezionato E data <= oggi
-    df_filtered_events = df_events[
-        (df_events['giorno'] == day) &
-        (df_events['mese'] == month) &
-        (df_events['data'] <= oggi)  # SOLO eventi passati
-        ].copy()
+    # Gruppi dell'indice con eventi passati (data <= oggi) nel giorno/mese selezionato di ogni
+    # anno, o nella finestra di ±window giorni attorno (allineata al giorno della settimana)
+    riferimento = reference_date(oggi.year, month, day) if weekday_aligned else None
+    targets = index.targets(month, day, oggi, riferimento)
+    day_rows, cells = index.window_cells(targets, window, oggi)
+    past_counts = (index.counts[day_rows] * (cells >= 0)).sum(axis=1)
+    has_events = past_counts > 0
+    day_rows, cells, past_counts = day_rows[has_events], cells[has_events], past_counts[has_events]
 
-    logger.info(f"Eventi passati trovati per {day:02d}/{month:02d}: {len(df_filtered_events)}")
-
-    # Applica filtri agli eventi
-    if filters.get('sedi'):
-        df_filtered_events = df_filtered_events[df_filtered_events['sede'].isin(filters['sedi'])]
-    if filters.get('comuni'):
-        df_filtered_events = df_filtered_events[df_filtered_events['seprag_cod'].isin(filters['comuni'])]
-    if filters.get('generi'):
-        df_filtered_events = df_filtered_events[df_filtered_events['GENERE_CAT'].isin(filters['generi'])]
-    if filters.get('locali'):
-        df_filtered_events = df_filtered_events[df_filtered_events['des_locale'].isin(filters['locali'])]
+    logger.info(f"Eventi passati trovati per {day:02d}/{month:02d} (±{window} giorni): {int(past_counts.sum())}")
 
-    logger.info(f"Eventi dopo filtri: {len(df_filtered_events)}")
+    # Applica filtri ai gruppi (gli attributi filtrati sono parte della chiave del gruppo)
+    keep = _filter_groups(index, day_rows, filters)
+    day_rows, cells = day_rows[keep], cells[keep]
 
-    # Calcola anni passati: solo gli anni in cui il giorno/mese selezionato è già passato
-    anno_corrente = oggi.year
-    mese_corrente = oggi.month
-    giorno_corrente = oggi.day
-
-    # Se la data selezionata è già passata quest'anno, includi l'anno corrente
-    data_selezionata_anno_corrente = datetime.date(anno_corrente, month,
-                                                   min(day, 28))  # min per evitare errori con febbraio
-    try:
-        data_selezionata_anno_corrente = datetime.date(anno_corrente, month, day)
-    except ValueError:
-        # Gestisce date invalide come 31 febbraio
-        pass
-
-    if data_selezionata_anno_corrente <= oggi:
-        anni_passati = [y for y in filters['available_years'] if y <= anno_corrente]
-    else:
-        anni_passati = [y for y in filters['available_years'] if y < anno_corrente]
+    logger.info(f"Eventi dopo filtri: {int(past_counts[keep].sum())}")
 
+    anni_passati = _anni_passati(day, month, filters['available_years'], oggi, riferimento)
     totale_anni_passati = len(anni_passati)
     logger.info(f"Anni passati considerati: {anni_passati}, totale: {totale_anni_passati}")
 
@@ -232,70 +297,137 @@ def calculate_recurrence_score(df_events, df_priority_scores, day, month, filter
     if filters.get('sedi'):
         df_filtered_locali = df_filtered_locali[df_filtered_locali['sede'].isin(filters['sedi'])]
 
-    results = []
+    df_results = _score_venues(index, day_rows, cells, df_filtered_locali, totale_anni_passati)
 
-    # Itera sui locali dal file Locali_{città}.csv
-    for _, locale_row in df_filtered_locali.iterrows():
-        locale_name = locale_row['des_locale']
-        sede = locale_row['sede']
-        priority_score = locale_row['priority_score']
+    if not df_results.empty:
+        df_results = df_results.sort_values('score', ascending=False).reset_index(drop=True)
 
-        # Cerca eventi per questo locale (solo passati)
-        locale_events = df_filtered_events[
-            (df_filtered_events['des_locale'] == locale_name) &
-            (df_filtered_events['sede'] == sede)
-            ]
+    logger.info(f"Locali con eventi: {len(df_results)}")
 
-        # Se non ha eventi in questa data, skippa
-        if locale_events.empty:
-            continue
+    return df_results
 
-        # Anni in cui il locale ha avuto eventi (solo passati)
-        anni_con_evento = sorted(locale_events['anno'].unique())
-
-        score_ricorrenza = len(anni_con_evento) / totale_anni_passati if totale_anni_passati > 0 else 0
-
-        # Score finale = prodotto
-        score_finale = score_ricorrenza * priority_score
-
-        # Prendi info del locale (prima riga eventi per dati aggiuntivi)
-        first_event = locale_events.iloc[0]
-
-        # Crea lista eventi dettagliata
-        eventi_dettaglio = []
-        for _, event in locale_events.iterrows():
-            eventi_dettaglio.append({
-                'anno': event['anno'],
-                'data': event['data'],
-                'data_ora_inizio': event['data_ora_inizio'],
-                'sede': event.get('sede', ''),
-                'comune': event.get('comune', '')
-            })
-
-        results.append({
-            'des_locale': locale_name,
-            'locale_genere': first_event.get('locale_genere', 'N/D'),
-            'indirizzo': first_event.get('indirizzo', 'N/D'),
-            'sede': sede,
-            'seprag_cod': first_event.get('seprag_cod', 'N/D'),
-            'comune': first_event.get('comune', 'N/D'),
-            'score_ricorrenza': score_ricorrenza,
-            'priority_score': priority_score,
-            'score': score_finale,
-            'anni_con_evento': anni_con_evento,
-            'totale_anni': totale_anni_passati,
-            'num_eventi_totali': len(locale_events),
-            'eventi_dettaglio': eventi_dettaglio
-        })
 
-    df_results = pd.DataFrame(results)
+def load_event_details(index, venue_id, day, month, filters, window=0, weekday_aligned=False):
+    """
+    Eventi di un singolo locale che concorrono al suo score per il giorno/mese indicato
+    (stesse regole e filtri di calculate_recurrence_score), letti dall'indice per
+    venue_id invece di essere materializzati per tutti i locali del risultato.
+    Ritorna una lista di dict con anno, data, data_ora_inizio, sede, comune.
+    """
+    oggi = datetime.datetime.now().date()
+    riferimento = reference_date(oggi.year, month, day) if weekday_aligned else None
 
-    if not df_results.empty:
-        df_results = df_results.sort_values('score', ascending=False).reset_index(drop=True)
+    rows = index.venue_rows(venue_id)
+    rows = rows[_filter_groups(index, rows, filters)]
+    cells = index.window_hits(rows, index.targets(month, day, oggi, riferimento), window, oggi)
 
-    logger.info(f"Locali con eventi: {len(df_results)}")
+    positions, slots, owner = index.group_events(rows)
+    positions = np.sort(positions[cells[owner, slots] >= 0])
 
-    return df_results
+    detail_columns = ['anno', 'data', 'data_ora_inizio', 'sede', 'comune']
+    records = index.events.iloc[positions][[c for c in detail_columns if c in index.events.columns]]
+    return records.reindex(columns=detail_columns, fill_value='').to_dict('records')
+
+
+def calculate_recurrence_calendar(index, df_priority_scores, dates, filters, window=0, weekday_aligned=False):
+    """
+    Score di ricorrenza e score finale di tutti i locali per un intervallo di date,
+    in un'unica passata vettoriale sull'indice delle ricorrenze.
+
+    Per ogni data valgono le stesse regole di calculate_recurrence_score (solo
+    eventi passati, anni passati calcolati per quel giorno/mese, finestra di
+    ±window giorni e allineamento al giorno della settimana della data stessa).
+
+    Ritorna un DataFrame "lungo" con una riga per coppia (locale, data) con eventi:
+    - venue_id, des_locale, sede, data
+    - score_ricorrenza, priority_score, score, num_anni, totale_anni, num_eventi_totali
+    """
+    dates = list(dates)
+    logger.info(f"Calcolo calendario ricorrenze per {len(dates)} giorni")
+
+    if df_priority_scores.empty or not dates:
+        return pd.DataFrame()
+
+    oggi = datetime.datetime.now().date()
+    n_days = len(dates)
+
+    # Gruppi dell'indice di ciascun giorno (con la posizione in dates) e celle in finestra
+    totale_anni = np.zeros(n_days, dtype=np.int64)
+    day_rows, day_cells, day_pos = [], [], []
+    for i, d in enumerate(dates):
+        riferimento = d if weekday_aligned else None
+        rows, cells = index.window_cells(index.targets(d.month, d.day, oggi, riferimento), window, oggi)
+        day_rows.append(rows)
+        day_cells.append(cells)
+        day_pos.append(np.full(len(rows), i))
+        totale_anni[i] = len(_anni_passati(d.day, d.month, filters['available_years'], oggi, riferimento))
+    rows = np.concatenate(day_rows)
+    cells = np.concatenate(day_cells)
+    day_pos = np.concatenate(day_pos)
+
+    # Eventi passati in finestra per gruppo e giorno, poi filtri della tab sui gruppi
+    past_counts = (index.counts[rows] * (cells >= 0)).sum(axis=1)
+    keep = (past_counts > 0) & _filter_groups(index, rows, filters)
+    rows, cells, day_pos, past_counts = rows[keep], cells[keep], day_pos[keep], past_counts[keep]
+
+    locali = df_priority_scores
+    if filters.get('sedi'):
+        locali = locali[locali['sede'].isin(filters['sedi'])]
+    locali = locali[['venue_id', 'des_locale', 'sede', 'priority_score']].reset_index(drop=True)
+
+    group_venue = _locali_positions(locali['venue_id'].to_numpy(), index.groups['venue_id'].to_numpy()[rows])
+    pos = np.flatnonzero(group_venue >= 0)
+    if not len(pos):
+        return pd.DataFrame()
+
+    # Celle (locale, giorno): OR delle maschere degli anni e somma degli eventi dei gruppi
+    cell_key = group_venue[pos] * n_days + day_pos[pos]
+    order = np.argsort(cell_key, kind='stable')
+    cell_key = cell_key[order]
+    masks = _cell_masks(cells[pos][order])
+    bounds = np.flatnonzero(np.r_[True, cell_key[1:] != cell_key[:-1]])
+
+    cell_venue, cell_day = np.divmod(cell_key[bounds], n_days)
+    num_anni = popcount(np.bitwise_or.reduceat(masks, bounds))
+    num_eventi = np.add.reduceat(past_counts[pos][order], bounds)
+
+    totale = totale_anni[cell_day]
+    score_ricorrenza = np.divide(num_anni, totale, out=np.zeros(len(num_anni)), where=totale > 0)
+    priority_score = locali['priority_score'].to_numpy()[cell_venue]
+
+    df_calendar = pd.DataFrame({
+        'venue_id': locali['venue_id'].to_numpy()[cell_venue],
+        'des_locale': locali['des_locale'].iloc[cell_venue].reset_index(drop=True),
+        'sede': locali['sede'].iloc[cell_venue].reset_index(drop=True),
+        'data': pd.to_datetime(pd.Series(dates)).to_numpy()[cell_day],
+        'score_ricorrenza': score_ricorrenza,
+        'priority_score': priority_score,
+        'score': score_ricorrenza * priority_score,
+        'num_anni': num_anni,
+        'totale_anni': totale,
+        'num_eventi_totali': num_eventi,
+    })
+
+    logger.info(f"Calendario ricorrenze: {len(df_calendar)} coppie locale/giorno")
+
+    return df_calendar
+
+
+def recurrence_matrix(df_calendar, dates, top_n=None):
+    """
+    Matrice locale (venue_id) x giorno dello score finale (0 dove il locale non ha eventi).
+    Con top_n restano solo i locali con lo score massimo più alto nell'intervallo.
+    """
+    columns = pd.to_datetime(pd.Series(list(dates)))
+    if df_calendar.empty:
+        return pd.DataFrame(columns=columns)
+
+    matrix = df_calendar.pivot_table(
+        index='venue_id', columns='data', values='score', aggfunc='max', fill_value=0.0,
+    ).reindex(columns=columns, fill_value=0.0)
+
+    matrix = matrix.loc[matrix.max(axis=1).sort_values(ascending=False).index]
+    return matrix.head(top_n) if top_n else matrix
 
 
 def show_event_details(eventi_dettaglio):
@@ -343,6 +475,263 @@ def show_event_details(eventi_dettaglio):
         """, unsafe_allow_html=True)
 
 
+GIORNI_SETTIMANA = ["Lun", "Mar", "Mer", "Gio", "Ven", "Sab", "Dom"]
+
+
+def show_recurrence_calendar(df_calendar, dates, col_table, col_details):
+    """
+    Vista calendario: heatmap dei giorni (settimane x giorni della settimana), tabella
+    riepilogativa selezionabile con i migliori locali del giorno e matrice locale x giorno.
+    """
+    dates = list(dates)
+    date_index = pd.to_datetime(pd.Series(dates))
+
+    # Riepilogo per giorno: locali con eventi, score massimo e locale migliore
+    riepilogo = pd.DataFrame({'locali': 0, 'score_max': 0.0, 'top_locale': '-'}, index=date_index)
+    if not df_calendar.empty:
+        per_giorno = df_calendar.sort_values('score', ascending=False).groupby('data').agg(
+            locali=('des_locale', 'size'),
+            score_max=('score', 'max'),
+            top_locale=('des_locale', 'first'),
+        )
+        riepilogo.loc[per_giorno.index, 'locali'] = per_giorno['locali'].to_numpy()
+        riepilogo.loc[per_giorno.index, 'score_max'] = per_giorno['score_max'].to_numpy()
+        riepilogo.loc[per_giorno.index, 'top_locale'] = per_giorno['top_locale'].astype(str).to_numpy()
+
+    with col_table:
+        st.subheader(f"Calendario - {dates[0].strftime('%d/%m/%Y')} / {dates[-1].strftime('%d/%m/%Y')}")
+
+        # Heatmap a calendario: righe = settimane, colonne = giorni della settimana
+        primo_lunedi = dates[0] - datetime.timedelta(days=dates[0].weekday())
+        n_settimane = (dates[-1] - primo_lunedi).days // 7 + 1
+        z = np.full((n_settimane, 7), np.nan)
+        testo = np.full((n_settimane, 7), "", dtype=object)
+        for d, (locali, score_max) in zip(dates, riepilogo[['locali', 'score_max']].itertuples(index=False)):
+            settimana = (d - primo_lunedi).days // 7
+            z[settimana, d.weekday()] = score_max
+            testo[settimana, d.weekday()] = f"{d.strftime('%d/%m')}<br>{locali} locali"
+        settimane = [(primo_lunedi + datetime.timedelta(weeks=w)).strftime("%d/%m") for w in range(n_settimane)]
+
+        fig_cal = go.Figure(go.Heatmap(
+            z=z,
+            x=GIORNI_SETTIMANA,
+            y=settimane,
+            text=testo,
+            texttemplate="%{text}",
+            colorscale="Blues",
+            colorbar=dict(title="Score max"),
+            hovertemplate="Settimana del %{y}, %{x}<br>%{text}<br>Score max: %{z:.3f}<extra></extra>",
+            xgap=3,
+            ygap=3,
+        ))
+        fig_cal.update_layout(
+            height=max(250, 60 * n_settimane),
+            yaxis=dict(autorange="reversed", title="Settimana del"),
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            margin=dict(t=20, b=20),
+        )
+        st.plotly_chart(fig_cal, use_container_width=True)
+
+        df_display = pd.DataFrame({
+            'Data': [f"{GIORNI_SETTIMANA[d.weekday()]} {d.strftime('%d/%m/%Y')}" for d in dates],
+            'Locali': riepilogo['locali'].to_numpy(),
+            'Score Max': [f"{x:.3f}" for x in riepilogo['score_max']],
+            'Locale Migliore': riepilogo['top_locale'].to_numpy(),
+        })
+        selected_day_row = st.dataframe(
+            df_display,
+            use_container_width=True,
+            hide_index=True,
+            on_select="rerun",
+            selection_mode="single-row",
+            key="recurrence_calendar_table"
+        )
+
+    with col_details:
+        st.subheader("Migliori Locali del Giorno")
+
+        if selected_day_row.selection and len(selected_day_row.selection['rows']) > 0:
+            giorno = date_index.iloc[selected_day_row.selection['rows'][0]]
+            df_giorno = df_calendar[df_calendar['data'] == giorno] if not df_calendar.empty else df_calendar
+            st.markdown(f"**{giorno.strftime('%d/%m/%Y')}**")
+
+            if df_giorno.empty:
+                st.info("Nessun locale con eventi in questa data")
+            else:
+                df_top = df_giorno.sort_values('score', ascending=False).head(20)
+                st.dataframe(
+                    pd.DataFrame({
+                        'Nome Locale': df_top['des_locale'].astype(str).to_numpy(),
+                        'Sede': df_top['sede'].astype(str).to_numpy(),
+                        'Score Ric.': [
+                            f"{r:.0%} ({n}/{t})" for r, n, t in
+                            zip(df_top['score_ricorrenza'], df_top['num_anni'], df_top['totale_anni'])
+                        ],
+                        'Score Finale': [f"{x:.3f}" for x in df_top['score']],
+                    }),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+        else:
+            st.info("Seleziona un giorno nella tabella per vedere i migliori locali")
+
+    # Matrice locale x giorno per i locali più rilevanti dell'intervallo
+    st.divider()
+    st.subheader("Matrice Locali x Giorni")
+
+    if df_calendar.empty:
+        st.info("Nessun locale con eventi nell'intervallo selezionato")
+        return
+
+    top_n = st.slider("Locali mostrati", min_value=10, max_value=100, value=30, step=10, key="recurrence_matrix_top")
+    matrix = recurrence_matrix(df_calendar, dates, top_n=top_n)
+    labels = df_calendar.drop_duplicates('venue_id').set_index('venue_id')[['des_locale', 'sede']]
+
+    fig_matrix = go.Figure(go.Heatmap(
+        z=matrix.to_numpy(),
+        x=[d.strftime("%d/%m") for d in dates],
+        y=[f"{labels.at[v, 'des_locale']} ({labels.at[v, 'sede']})" for v in matrix.index],
+        colorscale="Blues",
+        colorbar=dict(title="Score"),
+        hovertemplate="%{y}<br>%{x}: %{z:.3f}<extra></extra>",
+        xgap=1,
+        ygap=1,
+    ))
+    fig_matrix.update_layout(
+        height=max(300, 22 * len(matrix)),
+        yaxis=dict(autorange="reversed"),
+        xaxis=dict(tickangle=-45),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(t=20),
+    )
+    st.plotly_chart(fig_matrix, use_container_width=True)
+
+
+# Etichette "gg/mm" dei giorni dell'anno su calendario bisestile (indice = giorno_anno)
+DAY_LABELS = np.array([""] + [
+    (datetime.date(2000, 1, 1) + datetime.timedelta(days=i)).strftime("%d/%m") for i in range(366)
+])
+
+
+def show_year_distribution(index, df_priority_scores, available_years, filters, allowed_regions):
+    """
+    Grafico della distribuzione degli eventi passati nell'anno selezionato,
+    con gli stessi filtri usati per i risultati e gli eventuali anni di confronto.
+    I conteggi vengono dal cubo eventi (utils.event_cube) invece che dagli eventi.
+    """
+    st.divider()
+    st.subheader("Distribuzione Eventi nell'Anno")
+
+    # Selettore anno e anni di confronto
+    col_anno, col_confronto = st.columns([1, 3])
+    with col_anno:
+        selected_year = st.selectbox(
+            "Seleziona anno",
+            options=sorted(available_years, reverse=True),
+            key="distribution_year"
+        )
+    with col_confronto:
+        compare_years = st.multiselect(
+            "Confronta con",
+            options=[y for y in sorted(available_years, reverse=True) if y != selected_year],
+            default=[],
+            key="distribution_compare_years"
+        )
+
+    # Solo locali presenti in Locali_{città}.csv
+    locali_validi = df_priority_scores['venue_id'].unique().tolist() if not df_priority_scores.empty else None
+
+    if filters.get('locali'):
+        # Filtro per locale: somma diretta sui gruppi dell'indice dei soli locali selezionati
+        validi = set(locali_validi) if locali_validi is not None else None
+        locali = [l for l in filters['locali'] if validi is None or l in validi]
+        rows = np.concatenate([np.empty(0, dtype=np.int64)] + [index.venue_rows(l) for l in locali])
+        counts = day_counts(index, rows[_filter_groups(index, rows, filters)])
+    else:
+        cube = get_event_cube(allowed_regions, GENERI_PRIORITARI, locali_validi)
+        counts = cube.counts(filters.get('sedi'), filters.get('comuni'), filters.get('generi'))
+
+    # Solo eventi passati
+    oggi = datetime.datetime.now().date()
+    counts = mask_future(counts, index.years, oggi)
+
+    def year_counts(anno):
+        slot = np.searchsorted(index.years, anno)
+        if slot < len(index.years) and index.years[slot] == anno:
+            return counts[slot]
+        return np.zeros(counts.shape[1], dtype=np.int64)
+
+    eventi_anno = year_counts(selected_year)
+
+    if eventi_anno.sum() > 0:
+        x_labels = DAY_LABELS[1:]
+
+        # Crea line chart
+        fig_dist = go.Figure()
+
+        fig_dist.add_trace(go.Scatter(
+            x=x_labels,
+            y=eventi_anno[1:],
+            mode='lines',
+            fill='tozeroy',
+            line=dict(color='#667eea', width=2),
+            fillcolor='rgba(102, 126, 234, 0.2)',
+            name=str(selected_year),
+            hovertemplate='<b>%{x}</b><br>Eventi: %{y}<extra>' + str(selected_year) + '</extra>'
+        ))
+
+        # Anni di confronto sovrapposti
+        for anno, color in zip(compare_years, px.colors.qualitative.Set2):
+            fig_dist.add_trace(go.Scatter(
+                x=x_labels,
+                y=year_counts(anno)[1:],
+                mode='lines',
+                line=dict(color=color, width=1.5, dash='dot'),
+                name=str(anno),
+                hovertemplate='<b>%{x}</b><br>Eventi: %{y}<extra>' + str(anno) + '</extra>'
+            ))
+
+        titolo = f"Distribuzione eventi nel {selected_year}"
+        if compare_years:
+            titolo += " (confronto con " + ", ".join(str(a) for a in compare_years) + ")"
+
+        fig_dist.update_layout(
+            title=titolo,
+            xaxis_title="Giorno/Mese",
+            yaxis_title="Numero eventi",
+            height=400,
+            showlegend=bool(compare_years),
+            hovermode='x unified',
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            xaxis=dict(
+                tickangle=-45,
+                tickmode='array',
+                tickvals=x_labels[::15],  # Mostra ogni 15 giorni
+                ticktext=x_labels[::15]
+            )
+        )
+
+        st.plotly_chart(fig_dist, use_container_width=True)
+
+        # Info aggiuntiva
+        giorno_max = int(np.argmax(eventi_anno))
+        col_info1, col_info2, col_info3 = st.columns(3)
+
+        with col_info1:
+            st.metric("Giorno con più eventi", DAY_LABELS[giorno_max])
+        with col_info2:
+            st.metric(f"Eventi quel giorno ({selected_year})", f"{eventi_anno[giorno_max]:.0f}")
+        with col_info3:
+            delta = None
+            if len(compare_years) == 1:
+                delta = f"{int(eventi_anno.sum() - year_counts(compare_years[0]).sum()):+d} vs {compare_years[0]}"
+            st.metric(f"Totale eventi {selected_year}", f"{eventi_anno.sum():.0f}", delta=delta)
+    else:
+        st.info(f"Nessun evento disponibile per l'anno {selected_year} con i filtri selezionati")
+
 def render(allowed_regions=None):
     """
     Rendering principale del modulo Analisi Ricorrenze.
@@ -360,7 +749,8 @@ def render(allowed_regions=None):
         - **Score di ricorrenza**: % di anni in cui il locale ha fatto eventi in quella data
         - **Priority score**: priorità generale del locale
 
-        I locali sono ordinati per score finale decrescente.
+        I locali sono ordinati per score finale decrescente.  
+        In modalità **Calendario** lo score è calcolato per un intero intervallo di giorni.
         """
     )
 
@@ -375,9 +765,7 @@ def render(allowed_regions=None):
 
     # ========== CATEGORIZZAZIONE GENERI ==========
     if 'locale_genere' in df_events.columns:
-        df_events['GENERE_CAT'] = df_events['locale_genere'].apply(
-            lambda g: g if g in GENERI_PRIORITARI else "Altro"
-        )
+        df_events['GENERE_CAT'] = genere_category(df_events['locale_genere'], GENERI_PRIORITARI)
         logger.info("Creata colonna GENERE_CAT per categorizzazione generi")
     else:
         logger.warning("Colonna 'locale_genere' non trovata nei dati eventi")
@@ -402,28 +790,72 @@ def render(allowed_regions=None):
         default_day = domani.day
         default_month = domani.month
 
-        col_day, col_month = st.columns(2)
-        with col_day:
-            selected_day = st.number_input(
-                "Giorno",
-                min_value=1,
-                max_value=31,
-                value=default_day,
-                key="recurrence_day"
+        modalita = st.radio(
+            "Modalità",
+            options=["Giorno singolo", "Calendario"],
+            horizontal=True,
+            help="Calendario: score di tutti i locali per un intervallo di giorni",
+            key="recurrence_mode"
+        )
+        calendar_mode = modalita == "Calendario"
+
+        if calendar_mode:
+            data_inizio = st.date_input(
+                "Dal",
+                value=domani,
+                format="DD/MM/YYYY",
+                key="recurrence_calendar_start"
+            )
+            num_giorni = st.slider(
+                "Numero di giorni",
+                min_value=7,
+                max_value=90,
+                value=30,
+                key="recurrence_calendar_days"
+            )
+            calendar_dates = [data_inizio + datetime.timedelta(days=i) for i in range(num_giorni)]
+        else:
+            col_day, col_month = st.columns(2)
+            with col_day:
+                selected_day = st.number_input(
+                    "Giorno",
+                    min_value=1,
+                    max_value=31,
+                    value=default_day,
+                    key="recurrence_day"
+                )
+            with col_month:
+                mesi = {
+                    1: "Gennaio", 2: "Febbraio", 3: "Marzo", 4: "Aprile",
+                    5: "Maggio", 6: "Giugno", 7: "Luglio", 8: "Agosto",
+                    9: "Settembre", 10: "Ottobre", 11: "Novembre", 12: "Dicembre"
+                }
+                selected_month_name = st.selectbox(
+                    "Mese",
+                    options=list(mesi.values()),
+                    index=default_month - 1,  # Index è 0-based
+                    key="recurrence_month"
+                )
+                selected_month = list(mesi.keys())[list(mesi.values()).index(selected_month_name)]
+
+        col_window, col_weekday = st.columns(2)
+        with col_window:
+            window = st.number_input(
+                "Finestra (± giorni)",
+                min_value=0,
+                max_value=30,
+                value=0,
+                help="Conta anche gli eventi nei giorni vicini alla data (es. 3 = dal giorno -3 al giorno +3)",
+                key="recurrence_window"
             )
-        with col_month:
-            mesi = {
-                1: "Gennaio", 2: "Febbraio", 3: "Marzo", 4: "Aprile",
-                5: "Maggio", 6: "Giugno", 7: "Luglio", 8: "Agosto",
-                9: "Settembre", 10: "Ottobre", 11: "Novembre", 12: "Dicembre"
-            }
-            selected_month_name = st.selectbox(
-                "Mese",
-                options=list(mesi.values()),
-                index=default_month - 1,  # Index è 0-based
-                key="recurrence_month"
+        with col_weekday:
+            weekday_aligned = st.checkbox(
+                "Stesso giorno della settimana",
+                value=False,
+                help="Confronta gli anni sullo stesso giorno della settimana del mese (es. primo sabato) "
+                     "invece che sulla stessa data",
+                key="recurrence_weekday"
             )
-            selected_month = list(mesi.keys())[list(mesi.values()).index(selected_month_name)]
 
         st.divider()
 
@@ -482,10 +914,16 @@ def render(allowed_regions=None):
         if selected_genres:
             df_for_locali = df_for_locali[df_for_locali['GENERE_CAT'].isin(selected_genres)]
 
-        locali_options = sorted(df_for_locali['des_locale'].dropna().unique().tolist())
+        # Opzioni per venue_id: lo stesso nome in sedi diverse resta un locale distinto
+        df_locali_options = df_for_locali[df_for_locali['venue_id'] >= 0].drop_duplicates('venue_id')
+        locali_labels = dict(zip(
+            df_locali_options['venue_id'].tolist(),
+            (df_locali_options['des_locale'].astype(str) + " (" + df_locali_options['sede'].astype(str) + ")").tolist(),
+        ))
         selected_locali = st.multiselect(
             "Locali (opzionale)",
-            options=locali_options,
+            options=sorted(locali_labels, key=locali_labels.get),
+            format_func=locali_labels.get,
             default=[],
             key="recurrence_locali"
         )
@@ -500,7 +938,21 @@ def render(allowed_regions=None):
     }
 
     with st.spinner("Calcolo ricorrenze..."):
-        df_results = calculate_recurrence_score(df_events, df_priority_scores, selected_day, selected_month, filters)
+        index = get_recurrence_index(allowed_regions)
+        if calendar_mode:
+            df_calendar = calculate_recurrence_calendar(
+                index, df_priority_scores, calendar_dates, filters, window, weekday_aligned
+            )
+        else:
+            df_results = calculate_recurrence_score(
+                index, df_priority_scores, selected_day, selected_month, filters, window, weekday_aligned
+            )
+
+    # ========== CALENDARIO ==========
+    if calendar_mode:
+        show_recurrence_calendar(df_calendar, calendar_dates, col_table, col_details)
+        show_year_distribution(index, df_priority_scores, available_years, filters, allowed_regions)
+        return
 
     # ========== TABELLA RISULTATI ==========
     with col_table:
@@ -588,7 +1040,10 @@ def render(allowed_regions=None):
 
             # Dettagli eventi
             st.markdown("### Dettagli Eventi")
-            show_event_details(locale_data['eventi_dettaglio'])
+            show_event_details(load_event_details(
+                index, locale_data['venue_id'],
+                selected_day, selected_month, filters, window, weekday_aligned
+            ))
 
         else:
             st.info("Seleziona una riga nella tabella per vedere i dettagli")
@@ -616,111 +1071,4 @@ def render(allowed_regions=None):
         st.metric("Eventi Totali", tot_eventi)
 
     # ========== DISTRIBUZIONE EVENTI NELL'ANNO ==========
-    st.divider()
-    st.subheader("Distribuzione Eventi nell'Anno")
-
-    # Selettore anno
-    col_anno, col_space = st.columns([1, 3])
-    with col_anno:
-        selected_year = st.selectbox(
-            "Seleziona anno",
-            options=sorted(available_years, reverse=True),
-            key="distribution_year"
-        )
-
-    # Calcola distribuzione per l'anno selezionato
-    df_events_filtered = df_events.copy()
-
-    # Filtra per anno selezionato
-    df_events_filtered = df_events_filtered[df_events_filtered['anno'] == selected_year]
-
-    # Applica gli stessi filtri usati per i risultati
-    if selected_sedi:
-        df_events_filtered = df_events_filtered[df_events_filtered['sede'].isin(selected_sedi)]
-    if selected_comuni:
-        df_events_filtered = df_events_filtered[df_events_filtered['seprag_cod'].isin(selected_comuni)]
-    if selected_genres:
-        df_events_filtered = df_events_filtered[df_events_filtered['GENERE_CAT'].isin(selected_genres)]
-    if selected_locali:
-        df_events_filtered = df_events_filtered[df_events_filtered['des_locale'].isin(selected_locali)]
-
-    # Filtra solo locali presenti in Locali_{città}.csv
-    if not df_priority_scores.empty:
-        locali_validi = df_priority_scores['des_locale'].unique()
-        df_events_filtered = df_events_filtered[df_events_filtered['des_locale'].isin(locali_validi)]
-
-    # Solo eventi passati
-    oggi = datetime.datetime.now().date()
-    df_events_filtered = df_events_filtered[df_events_filtered['data'] <= oggi]
-
-    if not df_events_filtered.empty:
-        # Assicurati che giorno e mese siano int
-        df_events_filtered = df_events_filtered.copy()
-        df_events_filtered['giorno'] = pd.to_numeric(df_events_filtered['giorno'], errors='coerce')
-        df_events_filtered['mese'] = pd.to_numeric(df_events_filtered['mese'], errors='coerce')
-        df_events_filtered = df_events_filtered.dropna(subset=['giorno', 'mese'])
-        df_events_filtered['giorno'] = df_events_filtered['giorno'].astype(int)
-        df_events_filtered['mese'] = df_events_filtered['mese'].astype(int)
-
-        # Raggruppa per giorno/mese e conta eventi
-        eventi_per_giorno = df_events_filtered.groupby(['mese', 'giorno']).size().reset_index(name='num_eventi')
-
-        # Converti a int e gestisci eventuali NaN
-        eventi_per_giorno = eventi_per_giorno.dropna(subset=['mese', 'giorno'])
-        eventi_per_giorno['mese'] = eventi_per_giorno['mese'].astype(int)
-        eventi_per_giorno['giorno'] = eventi_per_giorno['giorno'].astype(int)
-
-        # Crea etichetta per l'asse X usando operazioni vettoriali
-        eventi_per_giorno['data_label'] = (
-                eventi_per_giorno['giorno'].astype(str).str.zfill(2) + '/' +
-                eventi_per_giorno['mese'].astype(str).str.zfill(2)
-        )
-
-        # Ordina per data
-        eventi_per_giorno = eventi_per_giorno.sort_values(['mese', 'giorno'])
-
-        # Crea line chart
-        fig_dist = go.Figure()
-
-        fig_dist.add_trace(go.Scatter(
-            x=eventi_per_giorno['data_label'],
-            y=eventi_per_giorno['num_eventi'],
-            mode='lines',
-            fill='tozeroy',
-            line=dict(color='#667eea', width=2),
-            fillcolor='rgba(102, 126, 234, 0.2)',
-            name='Eventi',
-            hovertemplate='<b>%{x}</b><br>Eventi: %{y}<extra></extra>'
-        ))
-
-        fig_dist.update_layout(
-            title=f"Distribuzione eventi nel {selected_year}",
-            xaxis_title="Giorno/Mese",
-            yaxis_title="Numero eventi",
-            height=400,
-            showlegend=False,
-            hovermode='x unified',
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(0,0,0,0)',
-            xaxis=dict(
-                tickangle=-45,
-                tickmode='array',
-                tickvals=eventi_per_giorno['data_label'][::15],  # Mostra ogni 15 giorni
-                ticktext=eventi_per_giorno['data_label'][::15]
-            )
-        )
-
-        st.plotly_chart(fig_dist, use_container_width=True)
-
-        # Info aggiuntiva
-        giorno_max = eventi_per_giorno.loc[eventi_per_giorno['num_eventi'].idxmax()]
-        col_info1, col_info2, col_info3 = st.columns(3)
-
-        with col_info1:
-            st.metric("Giorno con più eventi", giorno_max['data_label'])
-        with col_info2:
-            st.metric(f"Eventi quel giorno ({selected_year})", f"{giorno_max['num_eventi']:.0f}")
-        with col_info3:
-            st.metric(f"Totale eventi {selected_year}", f"{eventi_per_giorno['num_eventi'].sum():.0f}")
-    else:
-        st.info(f"Nessun evento disponibile per l'anno {selected_year} con i filtri selezionati")
\ No newline at end of file
+    show_year_distribution(index, df_priority_scores, available_years, filters, allowed_regions)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark del client HTTP della deep search contro il server di prova locale.
+
+Confronta una connessione nuova per ogni richiesta (requests.post, come prima della
+sessione condivisa) con la sessione keep-alive di utils.http_client, in sequenza e con
+più thread in parallelo, contando le connessioni aperte sul server.
+
+Uso:
+    python -m utils.benchmark_http                           # stretta di mano simulata da 50 ms
+    python -m utils.benchmark_http --connect-delay-ms 0 --requests 500
+    python -m utils.benchmark_http --certfile cert.pem --keyfile key.pem   # HTTPS reale (certificato non verificato)
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from utils import http_client
+from utils.mock_search_server import start_server
+
+
+def _run(post, url: str, n: int, workers: int, verify: bool) -> float:
+    payload = {"q": "Locale Roma evento 15/06/2025", "num": 5, "gl": "it", "hl": "it"}
+
+    def call(_):
+        r = post(url, json=payload, timeout=(3.05, 15), verify=verify)
+        r.raise_for_status()
+        return len(r.json()["organic"])
+
+    start = time.perf_counter()
+    if workers <= 1:
+        for i in range(n):
+            call(i)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(call, range(n)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=8, help="Thread paralleli (come SERPER_CONCURRENCY)")
+    parser.add_argument("--connect-delay-ms", type=float, default=50.0,
+                        help="Costo simulato di ogni nuova connessione sul server")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Ritardo simulato di ogni risposta")
+    parser.add_argument("--certfile")
+    parser.add_argument("--keyfile")
+    args = parser.parse_args()
+
+    server = start_server(connect_delay=args.connect_delay_ms / 1000, latency=args.latency_ms / 1000,
+                          certfile=args.certfile, keyfile=args.keyfile)
+    url = f"{server.base_url}/search"
+    verify = not args.certfile
+    if not verify:
+        requests.packages.urllib3.disable_warnings()
+
+    print(f"{args.requests} richieste verso {url}, stretta di mano simulata {args.connect_delay_ms:.0f} ms")
+    for workers in (1, args.workers):
+        results = {}
+        for name, post in (("nuova connessione", requests.post), ("sessione keep-alive", http_client.post)):
+            server.reset_stats()
+            elapsed = _run(post, url, args.requests, workers, verify)
+            results[name] = elapsed
+            print(f"{workers:2d} thread, {name:20s}: {elapsed / args.requests * 1000:8.2f} ms/richiesta, "
+                  f"{server.stats()['connections']:4d} connessioni")
+        print(f"{workers:2d} thread, guadagno: x{results['nuova connessione'] / results['sessione keep-alive']:.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
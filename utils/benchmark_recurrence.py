@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Benchmark del calcolo dello score di ricorrenza (tab Analisi Ricorrenze).
+
+Confronta calculate_recurrence_score (indice delle ricorrenze + aggregazioni
+vettoriali) con l'implementazione precedente basata su filtri e iterrows,
+verificando che i risultati coincidano, anche con i filtri comuni e locali.
+
+Uso:
+    python -m utils.benchmark_recurrence                  # città sintetica grande
+    python -m utils.benchmark_recurrence --sede Roma      # dati reali da EVENTI_CSV_DIR/LOCALI_CSV_DIR
+"""
+import argparse
+import datetime
+import time
+import numpy as np
+import pandas as pd
+from tabs import recurrence_analysis
+from utils.events_store import day_of_year
+from utils.recurrence_index import RecurrenceIndex
+from utils.schema import genere_category
+from utils.venues import VenueMaster, assign_venue_ids
+
+
+def _calculate_recurrence_score_iterrows(df_events, df_priority_scores, day, month, filters):
+    """Implementazione di riferimento: un filtro booleano sugli eventi per ogni locale"""
+    oggi = datetime.datetime.now().date()
+    df_filtered_events = df_events[
+        (df_events['giorno'] == day) &
+        (df_events['mese'] == month) &
+        (df_events['data'] <= pd.Timestamp(oggi))
+    ]
+    if filters.get('sedi'):
+        df_filtered_events = df_filtered_events[df_filtered_events['sede'].isin(filters['sedi'])]
+    if filters.get('comuni'):
+        df_filtered_events = df_filtered_events[df_filtered_events['seprag_cod'].isin(filters['comuni'])]
+    if filters.get('generi'):
+        df_filtered_events = df_filtered_events[df_filtered_events['GENERE_CAT'].isin(filters['generi'])]
+    if filters.get('locali'):
+        df_filtered_events = df_filtered_events[df_filtered_events['venue_id'].isin(filters['locali'])]
+
+    try:
+        data_anno_corrente = datetime.date(oggi.year, month, day)
+    except ValueError:
+        data_anno_corrente = datetime.date(oggi.year, month, min(day, 28))
+    last_year = oggi.year if data_anno_corrente <= oggi else oggi.year - 1
+    totale_anni_passati = len([y for y in filters['available_years'] if y <= last_year])
+
+    df_filtered_locali = df_priority_scores
+    if filters.get('sedi'):
+        df_filtered_locali = df_filtered_locali[df_filtered_locali['sede'].isin(filters['sedi'])]
+
+    results = []
+    for _, locale_row in df_filtered_locali.iterrows():
+        locale_name = locale_row['des_locale']
+        sede = locale_row['sede']
+        priority_score = locale_row['priority_score']
+
+        locale_events = df_filtered_events[
+            (df_filtered_events['des_locale'] == locale_name) &
+            (df_filtered_events['sede'] == sede)
+        ]
+        if locale_events.empty:
+            continue
+
+        anni_con_evento = sorted(locale_events['anno'].unique())
+        score_ricorrenza = len(anni_con_evento) / totale_anni_passati if totale_anni_passati > 0 else 0
+        first_event = locale_events.iloc[0]
+
+        eventi_dettaglio = []
+        for _, event in locale_events.iterrows():
+            eventi_dettaglio.append({
+                'anno': event['anno'],
+                'data': event['data'],
+                'data_ora_inizio': event['data_ora_inizio'],
+                'sede': event.get('sede', ''),
+                'comune': event.get('comune', '')
+            })
+
+        results.append({
+            'des_locale': locale_name,
+            'locale_genere': first_event.get('locale_genere', 'N/D'),
+            'indirizzo': first_event.get('indirizzo', 'N/D'),
+            'sede': sede,
+            'seprag_cod': first_event.get('seprag_cod', 'N/D'),
+            'comune': first_event.get('comune', 'N/D'),
+            'score_ricorrenza': score_ricorrenza,
+            'priority_score': priority_score,
+            'score': score_ricorrenza * priority_score,
+            'anni_con_evento': anni_con_evento,
+            'totale_anni': totale_anni_passati,
+            'num_eventi_totali': len(locale_events),
+            'eventi_dettaglio': eventi_dettaglio
+        })
+
+    df_results = pd.DataFrame(results)
+    if not df_results.empty:
+        df_results = df_results.sort_values('score', ascending=False).reset_index(drop=True)
+    return df_results
+
+
+def synthetic_city(n_venues: int, years: list, events_per_venue_day: float, seed: int = 0):
+    """Eventi (tutto l'anno, con il giorno più denso a metà giugno) e locali di una città sintetica"""
+    rng = np.random.default_rng(seed)
+    sede = "Sintetica"
+    venues = [f"Locale {i}" for i in range(n_venues)]
+
+    locali = pd.DataFrame({
+        'des_locale': venues,
+        'priority_score': rng.random(n_venues).astype('float32'),
+        'sede': sede,
+    }).astype({'des_locale': 'category', 'sede': 'category'})
+
+    frames = []
+    for anno in years:
+        # events_per_venue_day eventi medi per locale il 15/06, e altrettanti sparsi nell'anno
+        n_day = rng.poisson(events_per_venue_day * n_venues)
+        n_year = rng.poisson(events_per_venue_day * n_venues)
+        idx = rng.integers(0, n_venues, n_day + n_year)
+        offsets = np.r_[
+            np.full(n_day, (pd.Timestamp(anno, 6, 15) - pd.Timestamp(anno, 1, 1)).days),
+            rng.integers(0, 365, n_year),
+        ]
+        ts = (pd.Timestamp(anno, 1, 1)
+              + pd.to_timedelta(offsets, unit='D')
+              + pd.to_timedelta(rng.integers(0, 86400, n_day + n_year), unit='s'))
+        frames.append(pd.DataFrame({
+            'des_locale': np.asarray(venues)[idx],
+            'sede': sede,
+            'anno': np.int16(anno),
+            'comune': 'Comune',
+            'seprag_cod': rng.integers(100, 140, n_day + n_year),
+            'locale_genere': 'Discoteca',
+            'indirizzo': [f"Via {i}" for i in idx],
+            'data_ora_inizio': ts,
+            'data': ts.normalize(),
+            'giorno': ts.day,
+            'mese': ts.month,
+            'giorno_anno': day_of_year(ts.month.to_numpy(), ts.day.to_numpy()),
+        }))
+    events = pd.concat(frames, ignore_index=True).astype({
+        'des_locale': 'category', 'sede': 'category', 'comune': 'category',
+        'locale_genere': 'category', 'indirizzo': 'category',
+    })
+    # Anagrafica in memoria: i locali sintetici non finiscono in quella su disco
+    master = VenueMaster(path=None)
+    return assign_venue_ids(events, master=master), assign_venue_ids(locali, master=master)
+
+
+def _filtered_variants(events, day, month, filters):
+    """
+    Filtri comuni e comuni+locali per il confronto: i tre comuni con più eventi nel giorno
+    e un locale su tre fra quelli con eventi nel giorno in quei comuni
+    """
+    day_events = events[(events['giorno'] == day) & (events['mese'] == month)]
+    comuni = day_events['seprag_cod'].value_counts().head(3).index.tolist()
+    venue_ids = np.unique(day_events.loc[day_events['seprag_cod'].isin(comuni), 'venue_id'])
+    locali = venue_ids[venue_ids >= 0][::3].tolist()
+    return [
+        ("comuni", {**filters, 'comuni': comuni}),
+        ("comuni + locali", {**filters, 'comuni': comuni, 'locali': locali}),
+    ]
+
+
+def _compare(index, events, locali, day: int, month: int, filters: dict, repeat: int):
+    """Verifica che indice e implementazione di riferimento diano lo stesso risultato: (vec, ref, tempi)"""
+    t_vec, vec = _timeit(
+        lambda: recurrence_analysis.calculate_recurrence_score(index, locali, day, month, filters), repeat
+    )
+    t_ref, ref = _timeit(lambda: _calculate_recurrence_score_iterrows(events, locali, day, month, filters), 1)
+
+    if ref.empty:
+        assert vec.empty, f"{len(vec)} locali in più rispetto al riferimento"
+        return vec, t_vec, t_ref
+    pd.testing.assert_frame_equal(
+        vec.drop(columns='venue_id').astype(object).reset_index(drop=True),
+        ref.drop(columns='eventi_dettaglio').astype(object).reset_index(drop=True),
+        check_dtype=False,
+    )
+    # I dettagli si leggono su richiesta: confronto sui primi locali del risultato
+    for row, expected in zip(vec.head(20).itertuples(), ref['eventi_dettaglio']):
+        details = recurrence_analysis.load_event_details(index, row.venue_id, day, month, filters)
+        assert pd.DataFrame(details).astype(object).equals(pd.DataFrame(expected).astype(object)), row.des_locale
+    return vec, t_vec, t_ref
+
+
+def _timeit(fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sede", help="Sede reale da usare al posto dei dati sintetici")
+    parser.add_argument("--day", type=int, default=15)
+    parser.add_argument("--month", type=int, default=6)
+    parser.add_argument("--venues", type=int, default=20000, help="Locali della città sintetica")
+    parser.add_argument("--events-per-venue", type=float, default=0.5,
+                        help="Eventi medi per locale nel giorno selezionato, per anno (dati sintetici)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.sede:
+        events, years = recurrence_analysis.load_events_data([args.sede])
+        locali = recurrence_analysis.load_locali_priority_scores([args.sede])
+        filters = {'sedi': [args.sede], 'available_years': years}
+    else:
+        years = list(range(2019, 2026))
+        events, locali = synthetic_city(args.venues, years, args.events_per_venue)
+        filters = {'sedi': ['Sintetica'], 'available_years': years}
+    events = events.assign(GENERE_CAT=genere_category(events['locale_genere'], recurrence_analysis.GENERI_PRIORITARI))
+    print(f"Eventi: {len(events)}, locali: {len(locali)}, anni: {len(years)}")
+
+    t_index, index = _timeit(lambda: RecurrenceIndex(events), 1)
+    vec, t_vec, t_ref = _compare(index, events, locali, args.day, args.month, filters, args.repeat)
+    print(f"Risultati identici: {len(vec)} locali con eventi il {args.day:02d}/{args.month:02d}")
+    for name, filtered in _filtered_variants(events, args.day, args.month, filters):
+        vec_filtered, _, _ = _compare(index, events, locali, args.day, args.month, filtered, 1)
+        print(f"Risultati identici con filtro {name}: {len(vec_filtered)} locali")
+    print(f"costruzione indice (una volta per versione dati): {t_index * 1000:10.1f} ms")
+    print(f"iterrows:                                         {t_ref * 1000:10.1f} ms")
+    print(f"indice + vettoriale:                              {t_vec * 1000:10.1f} ms  (x{t_ref / t_vec:.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Chiamata rifiutata senza contattare il servizio: il circuito è aperto"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Servizio {name} non disponibile, nuovo tentativo tra {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker thread-safe per un servizio esterno, condiviso da tutte le sessioni.
+
+    Chiuso: le chiamate passano e i fallimenti consecutivi vengono contati. Dopo
+    failure_threshold fallimenti il circuito si apre e per reset_seconds le chiamate
+    falliscono subito (CircuitOpenError) invece di attendere il timeout. Poi il circuito
+    è semiaperto: passano al più half_open_max chiamate di prova; un successo lo richiude,
+    un fallimento lo riapre per un altro reset_seconds.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 half_open_max: int = 1):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = reset_seconds
+        self.half_open_max = max(1, int(half_open_max))
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        self.rejected = 0
+        self.trips = 0
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.reset_seconds:
+            self._state = HALF_OPEN
+            self._trials = 0
+            logger.info(f"Circuito {self.name}: semiaperto, chiamate di prova")
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def is_open(self) -> bool:
+        """Vero se una chiamata ora verrebbe rifiutata (senza prenotare una prova)"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return state == OPEN or (state == HALF_OPEN and self._trials >= self.half_open_max)
+
+    def _reject(self, now: float) -> CircuitOpenError:
+        self.rejected += 1
+        return CircuitOpenError(self.name, max(0.0, self._opened_at + self.reset_seconds - now))
+
+    def check(self):
+        """Solleva CircuitOpenError se una chiamata ora verrebbe rifiutata, senza prenotarla"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == OPEN or (state == HALF_OPEN and self._trials >= self.half_open_max):
+                raise self._reject(now)
+
+    def allow(self):
+        """
+        Prenota una chiamata: solleva CircuitOpenError se il circuito la rifiuta. Ogni
+        chiamata ammessa va chiusa con record_success, record_failure o release.
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._trials < self.half_open_max:
+                self._trials += 1
+                return
+            raise self._reject(now)
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuito {self.name}: servizio di nuovo disponibile, chiuso")
+            self._state = CLOSED
+            self._failures = 0
+            self._trials = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self.trips += 1
+                logger.warning(
+                    f"Circuito {self.name}: aperto dopo {self._failures} errori, "
+                    f"chiamate rifiutate per {self.reset_seconds:.0f}s"
+                )
+
+    def release(self):
+        """Chiamata prenotata e poi annullata senza esito: libera il posto di prova"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials:
+                self._trials -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            return {
+                "state": state,
+                "failures": self._failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "retry_in": round(max(0.0, self._opened_at + self.reset_seconds - now), 1) if state == OPEN else 0.0,
+            }
@@ -0,0 +1,61 @@
+import threading
+import logging
+from typing import Any, Callable, Hashable
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+class DatasetStore:
+    """
+    Archivio di dataset condiviso da tutte le sessioni Streamlit del processo.
+
+    Ogni voce è identificata da una chiave e da una versione (es. mtime e dimensione
+    del file sorgente): finché la versione non cambia tutte le sessioni ricevono lo
+    stesso oggetto, senza copie. Quando la versione cambia il dataset viene ricaricato
+    una sola volta e la versione precedente viene rilasciata.
+
+    Gli oggetti restituiti sono da considerare in sola lettura.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._key_locks = {}
+
+    def get(self, key: Hashable, version: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Un solo caricamento per chiave: le altre sessioni attendono e riusano il risultato
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == version:
+                    return entry[1]
+
+            logger.info(f"Caricamento dataset condiviso {key} (versione {version})")
+            value = loader()
+
+            with self._lock:
+                self._entries[key] = (version, value)
+            return value
+
+    def versions(self) -> dict:
+        """Versioni attualmente residenti, per diagnostica"""
+        with self._lock:
+            return {key: entry[0] for key, entry in self._entries.items()}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+@st.cache_resource
+def get_dataset_store() -> DatasetStore:
+    """Istanza unica del DatasetStore per l'intero processo"""
+    return DatasetStore()
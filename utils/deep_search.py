@@ -1,12 +1,17 @@
 import os
+import asyncio
 import requests
 import json
 import time
 import logging
 import hashlib
-from datetime import datetime, timedelta
-from pathlib import Path
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
+from utils import http_client
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.event_cache import EventCache, MemoryCache, TieredCache
+from utils.rate_limit import QUEUE_OWNER, TokenBucket, retry_after_seconds
 
 load_dotenv()
 
@@ -16,114 +21,354 @@ logging.basicConfig(level=logging.INFO)
 SERPER_API_KEY = os.environ.get("SERPER_API_KEY")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
-# Cache settings
-CACHE_DIR = Path("data/cache/events")
-CACHE_EXPIRY_HOURS = 24
+# Endpoint delle API (sostituibili con il server di prova utils.mock_search_server)
+SERPER_URL = os.getenv("SERPER_URL", "https://google.serper.dev/search")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
 
-logger.info("Modulo di verifica eventi inizializzato")
+# Modello e versione del prompt di verifica: cambiandoli si invalidano solo i verdetti,
+# non le ricerche già salvate
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
+PROMPT_VERSION = "2"
+VERDICT_VERSION = f"{GEMINI_MODEL}:{PROMPT_VERSION}"
 
-def _get_cache_key(venue: str, city: str, event_date: str) -> str:
-    """Genera una chiave univoca per la cache"""
-    key_string = f"{venue}|{city}|{event_date}".lower()
-    return hashlib.md5(key_string.encode()).hexdigest()
+# Quote delle API (richieste al minuto): gemini-2.5-flash-lite permette 15 RPM
+SERPER_RPM = float(os.getenv("SERPER_RPM", "300"))
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "15"))
 
-def _get_cache_path(cache_key: str) -> Path:
-    """Ottiene il percorso del file di cache"""
-    CACHE_DIR.mkdir(parents=True, exist_ok=True)
-    return CACHE_DIR / f"{cache_key}.json"
+# Un limiter per API, condiviso da tutte le sessioni del processo: si adatta alle
+# risposte 429 e serve a turno le code delle diverse sessioni
+SERPER_LIMITER = TokenBucket("serper", SERPER_RPM)
+GEMINI_LIMITER = TokenBucket("gemini", GEMINI_RPM)
 
-def _load_from_cache(cache_key: str) -> dict:
-    """Carica risultato dalla cache se valido"""
-    cache_path = _get_cache_path(cache_key)
+# Circuit breaker per API: dopo CIRCUIT_FAILURE_THRESHOLD errori consecutivi (rete, timeout,
+# risposte 5xx) le chiamate falliscono subito per CIRCUIT_RESET_SECONDS, poi una chiamata
+# di prova decide se richiudere il circuito
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+SERPER_BREAKER = CircuitBreaker("serper", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+GEMINI_BREAKER = CircuitBreaker("gemini", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
 
-    if not cache_path.exists():
-        return None
+# Tentativi aggiuntivi dopo una risposta 429, ognuno dopo il Retry-After indicato
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "3"))
 
-    try:
-        with open(cache_path, 'r', encoding='utf-8') as f:
-            cached_data = json.load(f)
+# Concorrenza dei due stadi della pipeline: le ricerche procedono in anticipo e
+# riempiono la coda che le verifiche (limitate dalla quota Gemini) svuotano
+SERPER_CONCURRENCY = int(os.getenv("SERPER_CONCURRENCY", "8"))
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "4"))
 
-        # Verifica se la cache è ancora valida
-        cached_time = datetime.fromisoformat(cached_data.get('timestamp', ''))
-        expiry_time = cached_time + timedelta(hours=CACHE_EXPIRY_HOURS)
+# Coppie (locale, data) verificate in una sola chiamata Gemini (1 = prompt singolo)
+GEMINI_BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", "5"))
 
-        if datetime.now() < expiry_time:
-            logger.info(f"Cache hit per chiave {cache_key}")
-            return cached_data.get('result')
-        else:
-            logger.info(f"Cache expired per chiave {cache_key}")
-            cache_path.unlink()
-            return None
+# Ricerca per intervallo: una query per locale per tutte le date, con più risultati
+RANGE_SEARCH_RESULTS = int(os.getenv("RANGE_SEARCH_RESULTS", "10"))
+RANGE_MAX_ITEMS = int(os.getenv("RANGE_MAX_ITEMS", "8"))
 
-    except Exception as e:
-        logger.warning(f"Errore lettura cache: {e}")
-        return None
+# Cache settings
+CACHE_PATH = os.getenv("DEEP_SEARCH_CACHE_PATH", "data/cache/events.sqlite")
+CACHE_MAX_ENTRIES = int(os.getenv("DEEP_SEARCH_CACHE_MAX_ENTRIES", "100000"))
+CACHE_MEMORY_ENTRIES = int(os.getenv("DEEP_SEARCH_CACHE_MEMORY_ENTRIES", "10000"))
+# Durata dei verdetti per esito: gli errori (spesso transitori) scadono presto,
+# gli eventi confermati restano validi a lungo
+OUTCOME_TTL_HOURS = {
+    "confirmed": float(os.getenv("TTL_CONFIRMED_HOURS", "168")),
+    "not_found": float(os.getenv("TTL_NOT_FOUND_HOURS", "24")),
+    "no_results": float(os.getenv("TTL_NO_RESULTS_HOURS", "12")),
+    "error": float(os.getenv("TTL_ERROR_HOURS", "0.25")),
+}
+# Per quanto un verdetto scaduto può ancora essere servito mentre viene aggiornato in background
+STALE_HOURS = float(os.getenv("DEEP_SEARCH_STALE_HOURS", "72"))
+SEARCH_CACHE_EXPIRY_HOURS = float(os.getenv("SEARCH_CACHE_EXPIRY_HOURS", "24"))
+
+# Cache condivisa da tutte le sessioni del processo: LRU in memoria davanti al file
+# SQLite (condiviso anche dalle repliche). Contiene due livelli con chiavi distinte:
+# risposte grezze di Serper per query ("search:") e verdetti Gemini ("verdict:").
+# L'event loop dello scheduler non tocca mai SQLite: le scritture vanno in coda al thread
+# della cache, le letture su disco in un pool dedicato, separato da quello delle chiamate
+# HTTP che possono restare occupate fino al timeout (vedi _cache_entries).
+# Aperta al primo uso (_event_cache): importare il modulo non crea file né thread
+_cache = None
+_cache_reader = None
+_cache_lock = threading.Lock()
+
+# Chiavi in aggiornamento in background (stale-while-revalidate)
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+
+# Single-flight: verifiche in corso per chiave, condivise da tutte le sessioni del processo.
+# Chi arriva per una chiave già in corso attende lo stesso risultato invece di rifare le chiamate
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Scheduler di processo: un event loop in un thread daemon esegue le pipeline di tutte le
+# sessioni (e gli aggiornamenti in background), le chiamate HTTP girano nel suo pool di thread
+_loop = None
+_loop_lock = threading.Lock()
 
-def _save_to_cache(cache_key: str, result: dict):
-    """Salva risultato nella cache"""
-    cache_path = _get_cache_path(cache_key)
+logger.info("Modulo di verifica eventi inizializzato")
 
-    try:
-        cached_data = {
-            'timestamp': datetime.now().isoformat(),
-            'result': result
-        }
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(cached_data, f, ensure_ascii=False, indent=2)
-        logger.info(f"Risultato salvato in cache: {cache_key}")
-    except Exception as e:
-        logger.warning(f"Errore salvataggio cache: {e}")
+def _event_cache() -> TieredCache:
+    """Cache dei verdetti e delle ricerche, aperta al primo uso"""
+    global _cache, _cache_reader
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache_reader = ThreadPoolExecutor(4, thread_name_prefix="deep-search-cache-read")
+                _cache = TieredCache(
+                    MemoryCache(CACHE_MEMORY_ENTRIES, stale_seconds=STALE_HOURS * 3600),
+                    EventCache(CACHE_PATH, CACHE_MAX_ENTRIES, stale_seconds=STALE_HOURS * 3600),
+                    writer=ThreadPoolExecutor(1, thread_name_prefix="deep-search-cache-write"),
+                )
+    return _cache
 
-def check_event_exists(venue: str, city: str, event_date: str):
-    # Controlla cache prima di fare le chiamate API
-    cache_key = _get_cache_key(venue, city, event_date)
-    cached_result = _load_from_cache(cache_key)
+def _get_cache_key(venue: str, city: str, event_date: str) -> str:
+    """Genera una chiave univoca per il verdetto, legata a modello e versione del prompt"""
+    key_string = f"{venue}|{city}|{event_date}".lower()
+    return f"verdict:{VERDICT_VERSION}:{hashlib.md5(key_string.encode()).hexdigest()}"
 
-    if cached_result is not None:
-        logger.info(f"Risultato trovato in cache per {venue}, {city}, {event_date}")
-        return cached_result
+def _get_search_key(q: str, num: int) -> str:
+    """Chiave della risposta grezza di Serper per una query"""
+    return f"search:{hashlib.md5(f'{q}|{num}'.lower().encode()).hexdigest()}"
 
-    q = f"{venue} {city} eventi {event_date}"
-    logger.info(f"Eseguo query evento: {q}")
+async def _cache_entries(keys: list, allow_stale: bool = False) -> dict:
+    """
+    Voci (valore, scadenza) delle chiavi presenti in cache. I hit in memoria sono letti
+    subito, le altre chiavi con una sola lettura su disco fuori dall'event loop: un lock
+    sul file SQLite condiviso non blocca le pipeline delle altre sessioni.
+    """
+    cache = _event_cache()
+    entries = {key: cache.memory.get_entry(key, allow_stale) for key in dict.fromkeys(keys)}
+    missing = [key for key, entry in entries.items() if entry is None]
+    if missing:
+        entries.update(await asyncio.get_running_loop().run_in_executor(
+            _cache_reader, lambda: {key: cache.get_disk_entry(key, allow_stale) for key in missing}
+        ))
+    return {key: entry for key, entry in entries.items() if entry is not None}
+
+def _cached_result(cache_key: str, entry):
+    """
+    Esito da una voce di cache: (esito, scaduto). Con allow_stale un verdetto scaduto da
+    meno di STALE_HOURS viene restituito con scaduto=True; gli errori scaduti mai.
+    """
+    if entry is None:
+        return None, False
+    result, expires_at = entry
+    stale = expires_at <= time.time()
+    if stale and result.get("error"):
+        return None, False
+    logger.info(f"Cache {'stale' if stale else 'hit'} per chiave {cache_key}")
+    return result, stale
+
+def _outcome(result: dict) -> str:
+    """Classe di esito di un verdetto, che ne determina la durata in cache"""
+    if result.get("error"):
+        return "error"
+    if result.get("exists"):
+        return "confirmed"
+    if result.get("no_results"):
+        return "no_results"
+    return "not_found"
 
-    # --- 1) Ricerca su Google via Serpenter
+def _save_to_cache(cache_key: str, result: dict):
+    """Salva risultato nella cache, con durata dipendente dall'esito"""
+    if result.get("circuit_open"):
+        # Il servizio non è stato nemmeno contattato: nessun verdetto da ricordare
+        return
+    outcome = _outcome(result)
+    _event_cache().set(cache_key, result, OUTCOME_TTL_HOURS[outcome] * 3600)
+    logger.info(f"Risultato salvato in cache ({outcome}): {cache_key}")
+
+def cache_stats() -> dict:
+    """Hit/miss dei due livelli della cache della deep search dall'avvio del processo"""
+    return _event_cache().stats()
+
+def _error_result(error) -> dict:
+    result = {"exists": False, "confidence": 0.0, "evidence": [], "error": str(error)}
+    if isinstance(error, CircuitOpenError):
+        result["circuit_open"] = True
+    return result
+
+def _verdict(obj: dict) -> dict:
+    """
+    Verdetto validato dalla risposta del modello: exists vale solo true (booleano o stringa
+    "true"), confidence è un numero tra 0 e 1, evidence una lista di URL.
+    """
+    if not isinstance(obj, dict):
+        raise ValueError(f"Verdetto non valido: {obj!r}")
+    exists = obj.get("exists")
+    if isinstance(exists, str):
+        exists = exists.strip().lower() == "true"
     try:
-        logger.info("Richiesta a Serper API")
-        resp = requests.post(
-            "https://google.serper.dev/search",
-            headers={"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"},
-            json={"q": q, "num": 5, "gl": "it", "hl": "it"},
-            timeout=30
-        )
-        resp.raise_for_status()
+        confidence = min(1.0, max(0.0, float(obj.get("confidence", 0.0))))
+    except (TypeError, ValueError):
+        confidence = 0.0
+    if confidence != confidence:  # NaN
+        confidence = 0.0
+    evidence = obj.get("evidence") or []
+    if isinstance(evidence, str):
+        evidence = [evidence]
+    return {
+        "exists": exists is True,
+        "confidence": confidence,
+        "evidence": [url for url in evidence if isinstance(url, str)] if isinstance(evidence, list) else [],
+    }
 
+def _with_evidence_meta(result: dict, items: list) -> dict:
+    """Aggiunge al verdetto titolo, snippet e data dei risultati di ricerca citati come evidenza"""
+    by_url = {it["url"]: it for it in items}
+    meta = [
+        {"title": by_url[url]["title"], "url": url, "snippet": by_url[url]["snippet"], "time": by_url[url].get("date", "")}
+        for url in result.get("evidence") or [] if url in by_url
+    ]
+    return {**result, "evidence_meta": meta} if meta else result
+
+def _save_dates(venue: str, city: str, event_dates: list, result: dict):
+    """Salva in cache lo stesso esito per tutte le date di una richiesta"""
+    for event_date in event_dates:
+        _save_to_cache(_get_cache_key(venue, city, event_date), result)
+
+def _search_query(venue: str, city: str, event_dates: list) -> str:
+    if len(event_dates) == 1:
+        return f"{venue} {city} eventi {event_dates[0]}"
+    return f"{venue} {city} eventi dal {event_dates[0]} al {event_dates[-1]}"
+
+async def _post(limiter: TokenBucket, breaker: CircuitBreaker, url: str, reserved: bool = False,
+                **kwargs) -> requests.Response:
+    """
+    POST in un thread, sulla sessione HTTP condivisa con connessioni keep-alive, dopo
+    aver preso il turno sul limiter (già preso se reserved).
+    Sulle risposte 429 il limiter rallenta e si sospende per il Retry-After, poi la
+    richiesta viene ritentata fino a RATE_LIMIT_RETRIES volte.
+    Con il circuito del servizio aperto solleva subito CircuitOpenError, senza attendere il
+    turno; la chiamata è ammessa dal circuito solo dopo il turno sul limiter. Errori di
+    rete e risposte 5xx contano come fallimenti del circuito.
+    """
+    breaker.check()
+    admitted = False
+    try:
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            if attempt or not reserved:
+                await limiter.wait()
+            if not admitted:
+                breaker.allow()
+                admitted = True
+            try:
+                resp = await asyncio.to_thread(http_client.post, url, **kwargs)
+            except requests.RequestException:
+                admitted = False
+                breaker.record_failure()
+                raise
+            if resp.status_code != 429:
+                limiter.reward()
+                break
+            limiter.penalize(retry_after_seconds(resp))
+            logger.warning(f"Limite superato su {limiter.name} (tentativo {attempt + 1})")
+    except BaseException:
+        # Chiamata ammessa senza esito (annullata o errore inatteso): libera la prova
+        if admitted:
+            breaker.release()
+        raise
+    if resp.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return resp
+
+async def _search_stage(venue: str, city: str, event_dates: list, use_cache: bool = True):
+    """
+    Primo stadio: ricerca su Serper, una sola query per tutte le date richieste del locale.
+    Restituisce (query, risultati organici, esito): l'esito è valorizzato (e salvato in
+    cache per ogni data) solo quando la verifica non serve (errore o nessun risultato).
+    Con use_cache=False (aggiornamento in background) la ricerca viene sempre rifatta:
+    la risposta salvata può durare più del verdetto scaduto che si sta aggiornando.
+    """
+    q = _search_query(venue, city, event_dates)
+    single = len(event_dates) == 1
+    num = 5 if single else RANGE_SEARCH_RESULTS
+    search_key = _get_search_key(q, num)
+
+    # Risposta grezza già salvata: una nuova verifica costa solo la chiamata Gemini
+    entry = (await _cache_entries([search_key])).get(search_key) if use_cache else None
+    organic = entry[0] if entry is not None else None
+    if organic is not None:
+        logger.info(f"Ricerca trovata in cache: {q}")
+    else:
+        logger.info(f"Eseguo query evento: {q}")
+
+        # --- 1) Ricerca su Google via Serpenter
         try:
-            search = resp.json()
-            logger.debug(f"Risposta Serper: {json.dumps(search, indent=2, ensure_ascii=False)}")
-        except ValueError as e:
-            logger.error(f"JSON non valido da Serper: {e}")
-            result = {"exists": False, "confidence": 0.0, "evidence": [], "error": f"Invalid JSON: {e}"}
-            _save_to_cache(cache_key, result)
-            return result
-
-    except requests.RequestException as e:
-        logger.error(f"Errore richiesta Serper: {e}")
-        result = {"exists": False, "confidence": 0.0, "evidence": [], "error": str(e)}
-        _save_to_cache(cache_key, result)
-        return result
+            logger.info("Richiesta a Serper API")
+            resp = await _post(
+                SERPER_LIMITER,
+                SERPER_BREAKER,
+                SERPER_URL,
+                headers={"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"},
+                json={"q": q, "num": num, "gl": "it", "hl": "it"},
+            )
+            resp.raise_for_status()
+
+            try:
+                search = resp.json()
+                logger.debug(f"Risposta Serper: {json.dumps(search, indent=2, ensure_ascii=False)}")
+            except ValueError as e:
+                logger.error(f"JSON non valido da Serper: {e}")
+                result = _error_result(f"Invalid JSON: {e}")
+                _save_dates(venue, city, event_dates, result)
+                return q, [], result
+
+        except CircuitOpenError as e:
+            logger.warning(str(e))
+            return q, [], _error_result(e)
+
+        except requests.RequestException as e:
+            logger.error(f"Errore richiesta Serper: {e}")
+            result = _error_result(str(e))
+            _save_dates(venue, city, event_dates, result)
+            return q, [], result
+
+        organic = search.get("organic", [])
+        # Una ricerca vuota non dura più del verdetto "no_results" che ne deriva
+        expiry_hours = SEARCH_CACHE_EXPIRY_HOURS if organic else min(
+            SEARCH_CACHE_EXPIRY_HOURS, OUTCOME_TTL_HOURS["no_results"]
+        )
+        _event_cache().set(search_key, organic, expiry_hours * 3600)
 
     items = [
-        {"title": r.get("title",""), "snippet": r.get("snippet",""), "url": r.get("link","")}
-        for r in search.get("organic", [])
-    ][:3]
+        {"title": r.get("title",""), "snippet": r.get("snippet",""), "url": r.get("link",""), "date": r.get("date","")}
+        for r in organic
+    ][:3 if single else RANGE_MAX_ITEMS]
 
     logger.info(f"Trovati {len(items)} risultati organici da Serper")
 
     if not items:
         logger.warning("Nessun risultato trovato da Serper")
-        result = {"exists": False, "confidence": 0.1, "evidence": []}
-        _save_to_cache(cache_key, result)
-        return result
+        result = {"exists": False, "confidence": 0.1, "evidence": [], "no_results": True}
+        _save_dates(venue, city, event_dates, result)
+        return q, items, result
+
+    return q, items, None
+
+async def _gemini_generate(payload: dict) -> str:
+    """Chiamata generateContent (il turno sul limiter va preso dal chiamante): testo della risposta"""
+    logger.info("Invio richiesta a Gemini API")
+    r = await _post(
+        GEMINI_LIMITER,
+        GEMINI_BREAKER,
+        f"{GEMINI_BASE_URL}/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}",
+        reserved=True,
+        json=payload,
+    )
+    r.raise_for_status()
+
+    data = r.json()
+    logger.debug(f"Risposta Gemini: {json.dumps(data, indent=2, ensure_ascii=False)}")
+
+    text = data["candidates"][0]["content"]["parts"][0]["text"]
+    logger.info("Risposta Gemini ottenuta correttamente")
+    return text
+
+async def _verify_single(venue: str, city: str, event_date: str, q: str, items: list) -> dict:
+    """Verifica con prompt singolo (il turno sul limiter va preso dal chiamante)"""
+    cache_key = _get_cache_key(venue, city, event_date)
 
     # --- 2) Prompt per Gemini
     logger.info("Preparazione payload per Gemini API")
@@ -155,26 +400,341 @@ def check_event_exists(venue: str, city: str, event_date: str):
     }
 
     try:
-        logger.info("Invio richiesta a Gemini API")
-        time.sleep(4)  # throttling: gemini-2.5-flash-lite permette 15 RPM (1 ogni 4s)
-        r = requests.post(
-            f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-lite:generateContent?key={GEMINI_API_KEY}",
-            json=payload,
-            timeout=30
-        )
-        r.raise_for_status()
-
-        data = r.json()
-        logger.debug(f"Risposta Gemini: {json.dumps(data, indent=2, ensure_ascii=False)}")
-
-        text = data["candidates"][0]["content"]["parts"][0]["text"]
-        logger.info("Risposta Gemini ottenuta correttamente")
-        result = json.loads(text)
+        result = _with_evidence_meta(_verdict(json.loads(await _gemini_generate(payload))), items)
         _save_to_cache(cache_key, result)
         return result
 
+    except CircuitOpenError as e:
+        logger.warning(str(e))
+        return _error_result(e)
+
     except Exception as e:
         logger.exception(f"Errore richiesta Gemini: {e}")
-        result = {"exists": False, "confidence": 0.0, "evidence": [], "error": str(e)}
+        result = _error_result(e)
         _save_to_cache(cache_key, result)
         return result
+
+def _batch_payload(batch: list) -> dict:
+    """
+    Prompt unico per più richieste (venue, city, event_dates, q, items), numerate da 1.
+    Una richiesta può riguardare più date dello stesso locale (ricerca per intervallo):
+    la risposta contiene un verdetto per ogni coppia (richiesta, data).
+    """
+    system_rules = """
+        Sei un verificatore eventi. Per ciascuna richiesta numerata e per ciascuna delle sue date devi stabilire se esiste un evento esattamente in quella data, presso il locale e nella città indicata.
+
+        Regole:
+        1. Per ogni data di ogni richiesta rispondi '"exists": true' solo se almeno UNA delle fonti di quella richiesta conferma in modo chiaro e inequivocabile che l’evento si svolge in quella data, nella città e nel locale indicati.
+        2. Se la data, la città o il locale non coincidono esattamente (anche con differenze minime, es. altro locale simile, città vicina o giorno diverso), rispondi '"exists": false'.
+        3. Non fare inferenze o supposizioni: usa esclusivamente le informazioni contenute negli URL forniti per quella richiesta, senza mescolare le fonti di richieste diverse.
+        4. Usa solo pagine web ufficiali o pagine social del locale.
+        5. La risposta deve essere **solo un array JSON**, senza testo aggiuntivo, con un oggetto per ogni data di ogni richiesta e la seguente struttura:
+        "id": numero della richiesta,
+        "data": data esattamente come scritta nella richiesta,
+        "exists": true|false,
+        "confidence": 0..1,
+        "evidence": ["url1","url2", ... ] (solo le fonti relative a quella data)
+    """
+
+    blocks = []
+    for n, (venue, city, event_dates, q, items) in enumerate(batch, start=1):
+        blocks.append(
+            f"Richiesta {n}: locale {venue}, città {city}, date: {'; '.join(event_dates)}\n"
+            + f"Query: {q}\n"
+            + "Risultati:\n"
+            + "\n".join([f"- {it['title']}\n  {it['snippet']}\n  {it['url']}" for it in items])
+        )
+
+    return {
+      "contents": [{"role": "user", "parts": [{"text": system_rules + "\n\n" + "\n\n".join(blocks)}]}],
+      "generationConfig": {"temperature": 0.2, "response_mime_type": "application/json"}
+    }
+
+def _parse_batch_verdicts(text: str, batch_dates: list) -> list:
+    """
+    Verdetti dalla risposta batch (array JSON di oggetti con "id" e "data"): per ogni
+    richiesta un dict data -> verdetto. Le date senza verdetto diventano errori.
+    """
+    data = json.loads(text)
+    if isinstance(data, dict):
+        # Alcune risposte incapsulano l'array in un oggetto
+        data = next((v for v in data.values() if isinstance(v, list)), [data])
+
+    verdicts = [{} for _ in batch_dates]
+    for obj in data:
+        try:
+            n = int(obj.get("id")) - 1
+        except (AttributeError, TypeError, ValueError):
+            continue
+        if not 0 <= n < len(batch_dates):
+            continue
+        event_dates = batch_dates[n]
+        event_date = str(obj.get("data", "")).strip()
+        match = next((d for d in event_dates if d.lower() == event_date.lower()), None)
+        if match is None and len(event_dates) == 1:
+            # Con una sola data il campo "data" non serve a distinguere
+            match = event_dates[0]
+        if match is not None and match not in verdicts[n]:
+            verdicts[n][match] = _verdict(obj)
+
+    missing = _error_result("Verdetto mancante nella risposta batch")
+    return [{d: v.get(d, missing) for d in event_dates} for v, event_dates in zip(verdicts, batch_dates)]
+
+async def _verify_batch_stage(batch: list) -> list:
+    """
+    Verifica con una sola chiamata Gemini di più richieste (venue, city, event_dates, q, items):
+    i verdetti vengono separati e salvati in cache per chiave (locale, città, data) come
+    nel prompt singolo. Il turno sul limiter va preso dal chiamante.
+    """
+    logger.info(f"Verifica batch di {len(batch)} richieste")
+    batch_dates = [event_dates for _, _, event_dates, _, _ in batch]
+    try:
+        results = _parse_batch_verdicts(await _gemini_generate(_batch_payload(batch)), batch_dates)
+    except CircuitOpenError as e:
+        logger.warning(str(e))
+        results = [{d: _error_result(e) for d in event_dates} for event_dates in batch_dates]
+    except Exception as e:
+        logger.exception(f"Errore richiesta Gemini (batch): {e}")
+        results = [{d: _error_result(e) for d in event_dates} for event_dates in batch_dates]
+
+    for (venue, city, _, _, items), verdicts in zip(batch, results):
+        for event_date, result in verdicts.items():
+            verdicts[event_date] = _with_evidence_meta(result, items)
+            _save_to_cache(_get_cache_key(venue, city, event_date), verdicts[event_date])
+    return results
+
+def _scheduler_loop() -> asyncio.AbstractEventLoop:
+    """Event loop dello scheduler di processo, avviato al primo uso"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                # Un thread per connessione del pool HTTP: oltre, le chiamate attenderebbero il pool
+                loop.set_default_executor(
+                    ThreadPoolExecutor(http_client.HTTP_POOL_SIZE, thread_name_prefix="deep-search-http")
+                )
+                threading.Thread(target=loop.run_forever, name="deep-search-scheduler", daemon=True).start()
+                logger.info("Scheduler deep search avviato")
+                _loop = loop
+    return _loop
+
+
+def _submit(coro, owner=None) -> Future:
+    """
+    Esegue la coroutine sullo scheduler di processo: tutte le sessioni condividono lo stesso
+    event loop, i limiter e il single-flight, invece di avviare un loop per ogni ricerca.
+    owner è il richiedente per il turno equo sui limiter.
+    """
+    async def run():
+        if owner is not None:
+            QUEUE_OWNER.set(owner)
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(run(), _scheduler_loop())
+
+
+def _revalidate(requests_list: list):
+    """
+    Aggiorna in background i verdetti scaduti già serviti al chiamante (stale-while-revalidate).
+    Le chiavi già in aggiornamento vengono saltate; l'aggiornamento gira sullo scheduler
+    di processo con gli stessi limiter delle verifiche in primo piano.
+    """
+    with _revalidating_lock:
+        keys = {}
+        for venue, city, event_date in requests_list:
+            cache_key = _get_cache_key(venue, city, event_date)
+            if cache_key not in _revalidating and cache_key not in keys:
+                keys[cache_key] = (venue, city, event_date)
+        _revalidating.update(keys)
+    if not keys:
+        return
+
+    units = {}
+    for venue, city, event_date in keys.values():
+        units.setdefault((venue, city), []).append(event_date)
+
+    def done(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Errore aggiornamento in background: {future.exception()}")
+        with _revalidating_lock:
+            _revalidating.difference_update(keys)
+
+    logger.info(f"Aggiornamento in background di {len(keys)} verdetti scaduti")
+    # Gli aggiornamenti in background hanno una propria coda sui limiter
+    _submit(
+        _run_pipeline([(venue, city, dates) for (venue, city), dates in units.items()], allow_stale=False),
+        owner="revalidate",
+    ).add_done_callback(done)
+
+
+async def _run_pipeline(units: list, allow_stale: bool = True, on_result=None) -> list:
+    """
+    Pipeline a due stadi su richieste (venue, city, event_dates): SERPER_CONCURRENCY ricerche
+    procedono in anticipo e accodano i risultati, GEMINI_CONCURRENCY verificatori svuotano
+    la coda al ritmo della quota Gemini, che resta satura finché c'è lavoro.
+    I verdetti scaduti (se allow_stale) vengono restituiti subito e aggiornati in background.
+    Le chiavi già in verifica altrove (anche in altre sessioni) non vengono rifatte: si
+    attende il risultato della verifica in corso (single-flight).
+    on_result(u, data, esito), se indicato, riceve ogni esito appena disponibile (subito
+    quelli in cache), anche da altri thread.
+    Restituisce, per ogni richiesta, un dict data -> esito.
+    """
+    results = [{} for _ in units]
+    to_search = []
+    to_refresh = []
+    owned = {}      # chiave -> Future di cui questa pipeline è responsabile
+    waiting = []    # (u, data, Future) di verifiche in corso altrove
+    entries = await _cache_entries(
+        [_get_cache_key(venue, city, d) for venue, city, event_dates in units for d in event_dates], allow_stale
+    )
+    for u, (venue, city, event_dates) in enumerate(units):
+        missing = []
+        for event_date in event_dates:
+            cache_key = _get_cache_key(venue, city, event_date)
+            cached_result, stale = _cached_result(cache_key, entries.get(cache_key))
+            if cached_result is not None:
+                logger.info(f"Risultato trovato in cache per {venue}, {city}, {event_date}")
+                results[u][event_date] = cached_result
+                if on_result is not None:
+                    on_result(u, event_date, cached_result)
+                if stale:
+                    to_refresh.append((venue, city, event_date))
+                continue
+            with _inflight_lock:
+                future = _inflight.get(cache_key)
+                if future is None:
+                    future = _inflight[cache_key] = owned[cache_key] = Future()
+                    missing.append(event_date)
+            if event_date not in missing:
+                waiting.append((u, event_date, future))
+                if on_result is not None:
+                    future.add_done_callback(lambda f, u=u, d=event_date: on_result(u, d, f.result()))
+        if missing:
+            to_search.append((u, missing))
+    if to_refresh:
+        _revalidate(to_refresh)
+    logger.info(
+        f"Verifica eventi: {sum(len(r) for r in results)} esiti in cache, {len(to_search)} ricerche, "
+        f"{len(waiting)} verifiche già in corso"
+    )
+
+    def publish(u, verdicts: dict):
+        """Registra gli esiti di una richiesta e li consegna a chi li attende"""
+        results[u].update(verdicts)
+        venue, city, _ = units[u]
+        for event_date, result in verdicts.items():
+            if on_result is not None:
+                on_result(u, event_date, result)
+            cache_key = _get_cache_key(venue, city, event_date)
+            future = owned.get(cache_key)
+            if future is not None and not future.done():
+                future.set_result(result)
+                with _inflight_lock:
+                    if _inflight.get(cache_key) is future:
+                        del _inflight[cache_key]
+
+    to_search.reverse()
+    to_verify = asyncio.Queue()
+
+    async def searcher():
+        while to_search:
+            u, event_dates = to_search.pop()
+            venue, city, _ = units[u]
+            try:
+                q, items, result = await _search_stage(venue, city, event_dates, use_cache=allow_stale)
+            except Exception as e:
+                logger.exception(f"Errore ricerca {venue}, {city}: {e}")
+                q, items, result = None, [], _error_result(e)
+            if result is not None:
+                publish(u, {d: result for d in event_dates})
+            else:
+                to_verify.put_nowait((u, event_dates, q, items))
+
+    async def verifier():
+        while True:
+            first = await to_verify.get()
+            # Il batch si completa dopo aver ottenuto il turno: nel frattempo la coda si riempie.
+            # Con il circuito aperto il turno non serve: la chiamata fallisce subito
+            if not GEMINI_BREAKER.is_open():
+                await GEMINI_LIMITER.wait()
+            batch = [first]
+            while len(batch) < max(1, GEMINI_BATCH_SIZE) and not to_verify.empty():
+                batch.append(to_verify.get_nowait())
+            try:
+                if len(batch) == 1 and len(first[1]) == 1:
+                    u, event_dates, q, items = first
+                    venue, city, _ = units[u]
+                    verdicts = [{event_dates[0]: await _verify_single(venue, city, event_dates[0], q, items)}]
+                else:
+                    verdicts = await _verify_batch_stage([
+                        (units[u][0], units[u][1], event_dates, q, items) for u, event_dates, q, items in batch
+                    ])
+                for (u, _, _, _), verdict in zip(batch, verdicts):
+                    publish(u, verdict)
+            except Exception as e:
+                logger.exception(f"Errore verifica batch: {e}")
+                for u, event_dates, _, _ in batch:
+                    publish(u, {d: _error_result(e) for d in event_dates})
+            finally:
+                for _ in batch:
+                    to_verify.task_done()
+
+    verifiers = [asyncio.create_task(verifier()) for _ in range(max(1, GEMINI_CONCURRENCY))]
+    try:
+        await asyncio.gather(*(searcher() for _ in range(max(1, SERPER_CONCURRENCY))))
+        await to_verify.join()
+    finally:
+        for task in verifiers:
+            task.cancel()
+        # Chi attende non deve restare appeso se questa pipeline si interrompe
+        with _inflight_lock:
+            for cache_key, future in owned.items():
+                if not future.done():
+                    future.set_result(_error_result("Verifica interrotta"))
+                if _inflight.get(cache_key) is future:
+                    del _inflight[cache_key]
+
+    for u, event_date, future in waiting:
+        results[u][event_date] = await asyncio.wrap_future(future)
+    return results
+
+
+def submit_events_range(venues: list, event_dates: list, owner=None):
+    """
+    Accoda allo scheduler di processo la verifica di più locali (venue, city) su più date,
+    senza attendere, con una sola ricerca per locale sull'intero intervallo.
+    Restituisce (futures, pipeline): per ogni locale un dict data -> Future dell'esito, che
+    si completa appena il verdetto è disponibile (subito se in cache), e il Future della
+    pipeline, da annullare con cancel() per fermare le chiamate ancora da fare.
+    """
+    event_dates = list(dict.fromkeys(event_dates))
+    futures = [{d: Future() for d in event_dates} for _ in venues]
+    if not venues or not event_dates:
+        pipeline = Future()
+        pipeline.set_result([])
+        return futures, pipeline
+
+    def on_result(u, event_date, result):
+        future = futures[u].get(event_date)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def done(task):
+        # Una pipeline interrotta non deve lasciare in attesa chi mostra i risultati
+        error = "Verifica interrotta" if task.cancelled() or task.exception() is None else str(task.exception())
+        for venue_futures in futures:
+            for future in venue_futures.values():
+                if not future.done():
+                    future.set_result(_error_result(error))
+
+    pipeline = _submit(
+        _run_pipeline([(venue, city, event_dates) for venue, city in venues], on_result=on_result), owner
+    )
+    pipeline.add_done_callback(done)
+    return futures, pipeline
+
+
+def circuit_stats() -> dict:
+    """Stato dei circuit breaker (closed, open, half_open) e secondi alla prossima prova"""
+    return {"serper": SERPER_BREAKER.stats(), "gemini": GEMINI_BREAKER.stats()}
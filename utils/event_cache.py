@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+class EventCache:
+    """
+    Cache persistente dei risultati della deep search su SQLite (WAL): una riga per chiave
+    con scadenza indicizzata, così la pulizia degli scaduti e il limite di dimensione sono
+    singole query invece di letture file per file.
+
+    Ogni thread usa la propria connessione; WAL e busy_timeout rendono sicure le scritture
+    concorrenti dei thread del processo e di più repliche dell'app sullo stesso file.
+
+    Le voci scadute restano leggibili (allow_stale) per altri stale_seconds, così il
+    chiamante può servirle subito mentre le aggiorna in background.
+    """
+
+    # Ogni quante scritture eliminare gli scaduti e applicare il limite di dimensione
+    PURGE_EVERY = 200
+
+    def __init__(self, path: str, max_entries: int = 100_000, stale_seconds: float = 0):
+        self.path = path
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)")
+        logger.info(f"Cache deep search SQLite: {path} (max {max_entries} voci)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_entry(self, key: str, allow_stale: bool = False) -> Optional[Tuple[dict, float]]:
+        """(valore, scadenza) della chiave se presente e non scaduta (o ancora servibile se allow_stale)"""
+        oldest = time.time() - (self.stale_seconds if allow_stale else 0)
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?", (key, oldest)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Errore lettura cache {key}: {e}")
+            row = None
+        self._count(row is not None)
+        return (json.loads(row[0]), row[1]) if row is not None else None
+
+    def get(self, key: str) -> Optional[dict]:
+        """Valore della chiave se presente e non scaduto"""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value: dict, ttl_seconds: float):
+        self.set_entry(key, value, time.time() + ttl_seconds)
+
+    def set_entry(self, key: str, value: dict, expires_at: float):
+        now = time.time()
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now, expires_at),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Errore scrittura cache {key}: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        if purge:
+            self.purge()
+
+    def purge(self) -> int:
+        """Elimina in blocco le voci scadute (oltre la finestra stale) e le più vicine alla scadenza oltre max_entries"""
+        try:
+            with self._connection() as conn:
+                removed = conn.execute(
+                    "DELETE FROM cache WHERE expires_at <= ?", (time.time() - self.stale_seconds,)
+                ).rowcount
+                excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    removed += conn.execute(
+                        "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at LIMIT ?)",
+                        (excess,),
+                    ).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Errore pulizia cache: {e}")
+            return 0
+        if removed:
+            logger.info(f"Cache deep search: eliminate {removed} voci")
+        return removed
+
+    def stats(self) -> dict:
+        """Contatori hit/miss del processo e voci presenti nel file"""
+        try:
+            entries = self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+class MemoryCache:
+    """
+    LRU in memoria, limitata a max_entries voci e thread-safe, con la stessa scadenza
+    per voce della cache su disco. I valori sono condivisi tra le sessioni: chi li
+    legge non deve modificarli.
+    """
+
+    def __init__(self, max_entries: int = 10_000, stale_seconds: float = 0):
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_entry(self, key: str, allow_stale: bool = False) -> Optional[Tuple[dict, float]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now - self.stale_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is not None and not allow_stale and entry[1] <= now:
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set_entry(self, key: str, value: dict, expires_at: float):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, key: str, value: dict, ttl_seconds: float):
+        self.set_entry(key, value, time.time() + ttl_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class TieredCache:
+    """
+    Cache a due livelli: LRU in memoria davanti alla cache persistente. Le letture che
+    trovano la voce su disco la riportano in memoria con la sua scadenza originale, così
+    le richieste ripetute (anche da sessioni diverse) non toccano più il disco.
+
+    Con writer (un executor a un solo thread) le scritture su disco avvengono in coda nel
+    suo thread (write-behind): chi scrive aggiorna subito la memoria e non attende SQLite,
+    né i lock del file condiviso né la pulizia periodica.
+    """
+
+    def __init__(self, memory: MemoryCache, disk: EventCache, writer: Optional[Executor] = None):
+        self.memory = memory
+        self.disk = disk
+        self.writer = writer
+
+    def get_disk_entry(self, key: str, allow_stale: bool = False) -> Optional[Tuple[dict, float]]:
+        """Lettura dal solo disco (bloccante), con promozione in memoria"""
+        entry = self.disk.get_entry(key, allow_stale)
+        if entry is not None:
+            self.memory.set_entry(key, *entry)
+        return entry
+
+    def get_entry(self, key: str, allow_stale: bool = False) -> Optional[Tuple[dict, float]]:
+        entry = self.memory.get_entry(key, allow_stale)
+        if entry is None:
+            entry = self.get_disk_entry(key, allow_stale)
+        return entry
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value: dict, ttl_seconds: float):
+        expires_at = time.time() + ttl_seconds
+        self.memory.set_entry(key, value, expires_at)
+        if self.writer is not None:
+            self.writer.submit(self.disk.set_entry, key, value, expires_at)
+        else:
+            self.disk.set_entry(key, value, expires_at)
+
+    def stats(self) -> dict:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats()}
@@ -0,0 +1,107 @@
+import datetime
+import logging
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+from utils import events_store
+from utils.dataset_store import get_dataset_store
+from utils.recurrence_index import DAYS_PER_YEAR, RecurrenceIndex, get_recurrence_index
+from utils.schema import genere_category
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Dimensioni di filtro del cubo, oltre ad anno e giorno dell'anno
+CUBE_COLUMNS = ["sede", "seprag_cod", "GENERE_CAT"]
+
+
+def day_counts(index: RecurrenceIndex, rows: np.ndarray) -> np.ndarray:
+    """Conteggio eventi (anni x giorni dell'anno) dei gruppi indicati dell'indice"""
+    giorno_anno = index.groups["giorno_anno"].to_numpy()[rows].astype(np.int64)
+    n_years = len(index.years)
+    cells = np.arange(n_years) * (DAYS_PER_YEAR + 1) + giorno_anno[:, None]
+    counts = np.bincount(
+        cells.ravel(), weights=index.counts[rows].ravel(), minlength=n_years * (DAYS_PER_YEAR + 1)
+    )
+    return counts.reshape(n_years, DAYS_PER_YEAR + 1).astype(np.int64)
+
+
+def mask_future(counts: np.ndarray, years: np.ndarray, oggi: datetime.date) -> np.ndarray:
+    """Azzera le celle (anno, giorno dell'anno) successive a oggi"""
+    oggi_giorno_anno = events_store.day_of_year(oggi.month, oggi.day)
+    future = (years > oggi.year)[:, None] | (
+        (years == oggi.year)[:, None] & (np.arange(DAYS_PER_YEAR + 1) > oggi_giorno_anno)[None, :]
+    )
+    return np.where(future, 0, counts)
+
+
+class EventCube:
+    """
+    Cubo materializzato dei conteggi eventi: per ogni combinazione di (sede, seprag_cod,
+    GENERE_CAT) una matrice anni x giorni dell'anno (colonna = giorno_anno, 0 inutilizzata).
+
+    Qualsiasi combinazione di filtri su quelle dimensioni è una selezione di righe e
+    una somma; tutti gli anni sono disponibili insieme per i confronti anno su anno.
+    Viene costruito dai gruppi dell'indice delle ricorrenze, eventualmente ristretti
+    ai locali presenti nei file Locali.
+    """
+
+    def __init__(self, index: RecurrenceIndex, generi_prioritari: Iterable[str],
+                 valid_venues: Optional[Iterable[int]] = None):
+        self.years = index.years
+        groups = index.groups
+        if not {"sede", "venue_id", "seprag_cod", "locale_genere"} <= set(groups.columns):
+            # Indice vuoto (nessun evento): cubo senza combinazioni
+            groups = pd.DataFrame({
+                "giorno_anno": pd.Series(dtype="int16"),
+                "venue_id": pd.Series(dtype="int32"),
+                **{c: pd.Series(dtype="object") for c in ["sede", "seprag_cod", "locale_genere"]},
+            })
+
+        rows = np.arange(len(groups))
+        if valid_venues is not None:
+            rows = rows[np.isin(groups["venue_id"].to_numpy(), np.fromiter(valid_venues, dtype=np.int64))]
+
+        dims = pd.DataFrame({
+            "sede": groups["sede"].iloc[rows].reset_index(drop=True),
+            "seprag_cod": groups["seprag_cod"].iloc[rows].reset_index(drop=True),
+            "GENERE_CAT": genere_category(groups["locale_genere"].iloc[rows], generi_prioritari).reset_index(drop=True),
+        })
+
+        # Una riga del cubo per ogni combinazione distinta delle dimensioni di filtro
+        key = np.zeros(len(dims), dtype=np.int64)
+        for col in CUBE_COLUMNS:
+            codes = pd.factorize(dims[col], use_na_sentinel=False)[0].astype(np.int64)
+            key = key * (codes.max(initial=0) + 1) + codes
+        unique_keys, first, combo = np.unique(key, return_index=True, return_inverse=True)
+        self.combos = dims.iloc[first].reset_index(drop=True)
+
+        n_years, n_days = len(self.years), DAYS_PER_YEAR + 1
+        giorno_anno = groups["giorno_anno"].to_numpy()[rows].astype(np.int64)
+        cells = (combo[:, None] * n_years + np.arange(n_years)) * n_days + giorno_anno[:, None]
+        cube = np.bincount(
+            cells.ravel(), weights=index.counts[rows].ravel(), minlength=len(unique_keys) * n_years * n_days
+        )
+        self.cube = cube.reshape(len(unique_keys), n_years, n_days).astype(np.uint32)
+        logger.info(f"Cubo eventi costruito: {len(self.combos)} combinazioni, {self.cube.nbytes / 1e6:.1f} MB")
+
+    def counts(self, sedi=None, comuni=None, generi=None) -> np.ndarray:
+        """Conteggi (anni x giorni dell'anno) per i filtri indicati (None o vuoto = tutti)"""
+        keep = np.ones(len(self.combos), dtype=bool)
+        for col, values in (("sede", sedi), ("seprag_cod", comuni), ("GENERE_CAT", generi)):
+            if values:
+                keep &= self.combos[col].isin(values).to_numpy()
+        return self.cube[keep].sum(axis=0, dtype=np.int64)
+
+
+def get_event_cube(sedi: Iterable[str], generi_prioritari: Iterable[str],
+                   valid_venues: Optional[Iterable[int]] = None) -> EventCube:
+    """Cubo eventi delle sedi, condiviso e ricostruito solo quando cambiano eventi o locali validi"""
+    sedi = sorted(sedi)
+    generi_prioritari = tuple(generi_prioritari)
+    valid_venues = frozenset(valid_venues) if valid_venues is not None else None
+    version = (events_store.events_version(sedi), valid_venues)
+    return get_dataset_store().get(
+        ("event_cube", tuple(sedi), generi_prioritari), version,
+        lambda: EventCube(get_recurrence_index(sedi), generi_prioritari, valid_venues),
+    )
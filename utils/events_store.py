@@ -0,0 +1,170 @@
+import os
+import logging
+from pathlib import Path
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from utils.dataset_store import get_dataset_store
+from utils.persistence import DATA_DIR, source_signature, read_parquet_cache, write_parquet_cache
+from utils.schema import EVENTI_SCHEMA, apply_schema, concat_frames
+from utils.venues import assign_venue_ids
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Stesso default della tab ricorrenze prima dello store ("data" se DATA_DIR non è impostata),
+# non quello di persistence.DATA_DIR ("/app/data")
+EVENTI_CSV_DIR = os.getenv("EVENTI_CSV_DIR", os.getenv("DATA_DIR", "data"))
+EVENTI_STORE_DIR = os.getenv("EVENTI_STORE_DIR", os.path.join(DATA_DIR, "cache", "eventi"))
+# Formato di data_ora_inizio (es. "%Y-%m-%d %H:%M:%S"); se vuoto viene dedotto da pandas
+EVENTI_DATE_FORMAT = os.getenv("EVENTI_DATE_FORMAT") or None
+logger.info(f"EVENTI_CSV_DIR impostato a: {EVENTI_CSV_DIR}")
+logger.info(f"EVENTI_STORE_DIR impostato a: {EVENTI_STORE_DIR}")
+
+# Giorni cumulati a inizio mese su calendario bisestile: giorno_anno = offset[mese] + giorno
+_LEAP_MONTH_OFFSET = np.array([0, 0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335], dtype=np.int16)
+
+
+def day_of_year(month, day):
+    """
+    Giorno dell'anno su calendario bisestile (1..366, il 29/02 è sempre 60):
+    la stessa coppia giorno/mese ha lo stesso valore in tutti gli anni.
+    """
+    return _LEAP_MONTH_OFFSET[month] + day
+
+
+def list_event_partitions(sedi: Iterable[str]) -> list:
+    """Partizioni (sede, anno, percorso CSV) disponibili per le sedi indicate"""
+    partitions = []
+    for sede in sedi:
+        for file_path in sorted(Path(EVENTI_CSV_DIR).glob(f"Eventi_{sede}_*.csv")):
+            # Eventi_Roma_2025 -> anno 2025; il nome della sede può contenere "_"
+            year_part = file_path.stem[len(f"Eventi_{sede}_"):]
+            if not year_part.isdigit():
+                logger.warning(f"Impossibile estrarre anno da {file_path.stem}")
+                continue
+            partitions.append((sede, int(year_part), str(file_path)))
+    return partitions
+
+
+def _ingest_partition(sede: str, anno: int, csv_path: str) -> pd.DataFrame:
+    """Legge un CSV eventi e precalcola le colonne intere di data, ordinando per giorno_anno"""
+    df = pd.read_csv(csv_path)
+    df["anno"] = anno
+    df["sede"] = sede
+
+    if "data_ora_inizio" in df.columns:
+        df["data_ora_inizio"] = pd.to_datetime(df["data_ora_inizio"], format=EVENTI_DATE_FORMAT, errors="coerce")
+        valid = df["data_ora_inizio"].notna().to_numpy()
+        mese = df["data_ora_inizio"].dt.month
+        giorno = df["data_ora_inizio"].dt.day
+        df["giorno"] = giorno
+        df["mese"] = mese
+        df["data"] = df["data_ora_inizio"].dt.normalize()
+
+        # Le date non valide hanno giorno_anno = 0 e finiscono in testa alla partizione
+        giorno_anno = np.zeros(len(df), dtype=np.int16)
+        giorno_anno[valid] = day_of_year(mese[valid].to_numpy(dtype=int), giorno[valid].to_numpy(dtype=int))
+        df["giorno_anno"] = giorno_anno
+        df = df.sort_values("giorno_anno", kind="stable")
+
+    return apply_schema(df.reset_index(drop=True), EVENTI_SCHEMA)
+
+
+def _load_partition(sede: str, anno: int, csv_path: str, signature: tuple) -> pd.DataFrame:
+    cache_path = os.path.join(EVENTI_STORE_DIR, f"sede={sede}", f"anno={anno}", "eventi.parquet")
+
+    df = read_parquet_cache(cache_path, signature)
+    if df is not None:
+        logger.info(f"Eventi {sede} {anno} caricati dallo store: {len(df)} righe")
+        # Parquet conserva come dizionario solo le categoriche testuali
+        df = apply_schema(df, EVENTI_SCHEMA)
+    else:
+        df = _ingest_partition(sede, anno, csv_path)
+        logger.info(f"Eventi {sede} {anno} importati da {csv_path}: {len(df)} righe")
+        write_parquet_cache(cache_path, df, signature)
+
+    # Gli ID dei locali non sono salvati nello store: vengono sempre dall'anagrafica corrente
+    return assign_venue_ids(df)
+
+
+def _partition_frame(sede: str, anno: int, csv_path: str) -> pd.DataFrame:
+    signature = source_signature(csv_path)
+    return get_dataset_store().get(
+        ("eventi", sede, anno), signature, lambda: _load_partition(sede, anno, csv_path, signature)
+    )
+
+
+def _slice_day(df: pd.DataFrame, giorno_anno: int) -> pd.DataFrame:
+    """Righe di un giorno dell'anno: le partizioni sono ordinate, basta una ricerca binaria"""
+    keys = df["giorno_anno"].to_numpy()
+    start, stop = np.searchsorted(keys, [giorno_anno, giorno_anno + 1])
+    return df.iloc[start:stop]
+
+
+def _partitions_version(partitions: list) -> tuple:
+    return tuple((sede, anno, source_signature(csv_path)) for sede, anno, csv_path in partitions)
+
+
+def events_version(sedi: Iterable[str]) -> tuple:
+    """
+    Versione dei dati eventi delle sedi indicate: cambia quando cambia uno dei CSV.
+    Serve a versionare le strutture derivate (indici, aggregati) nel DatasetStore.
+    """
+    return _partitions_version(list_event_partitions(sedi))
+
+
+def load_events(
+    sedi: Iterable[str],
+    anni: Optional[Iterable[int]] = None,
+    mese: Optional[int] = None,
+    giorno: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Eventi delle sedi indicate, dallo store partizionato per sede/anno.
+
+    I predicati vengono applicati il prima possibile: sedi e anni selezionano le
+    partizioni da leggere, giorno e mese (da indicare insieme) una fetta contigua
+    di ciascuna partizione. Come load_csv_city restituisce una vista sul frame condiviso.
+    """
+    sedi = list(sedi)
+    anni = set(anni) if anni is not None else None
+    partitions = [
+        p for p in list_event_partitions(sedi)
+        if anni is None or p[1] in anni
+    ]
+    if not partitions:
+        return pd.DataFrame()
+
+    if mese is not None and giorno is not None:
+        giorno_anno = int(day_of_year(mese, giorno))
+        frames = []
+        for sede, anno, csv_path in partitions:
+            try:
+                frames.append(_slice_day(_partition_frame(sede, anno, csv_path), giorno_anno))
+            except Exception as e:
+                logger.error(f"Errore caricamento eventi {sede} {anno}: {e}")
+        return concat_frames(frames) if frames else pd.DataFrame()
+
+    # Caricamento completo: anche il frame unificato è condiviso, versionato sulle partizioni
+    version = _partitions_version(partitions)
+
+    def _load_all():
+        frames = []
+        for sede, anno, csv_path in partitions:
+            try:
+                frames.append(_partition_frame(sede, anno, csv_path))
+            except Exception as e:
+                logger.error(f"Errore caricamento eventi {sede} {anno}: {e}")
+        return concat_frames(frames) if frames else pd.DataFrame()
+
+    key = ("eventi_all", tuple(sorted(sedi)), tuple(sorted(anni)) if anni is not None else None)
+    return get_dataset_store().get(key, version, _load_all).copy(deep=False)
+
+
+def available_years(sedi: Iterable[str]) -> list:
+    """Anni per cui esiste almeno un file eventi delle sedi indicate"""
+    return sorted({anno for _, anno, _ in list_event_partitions(sedi)})
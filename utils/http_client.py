@@ -0,0 +1,60 @@
+import os
+import logging
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Connessioni keep-alive tenute aperte per host: almeno la concorrenza massima verso
+# ciascuna API (ricerche o verifiche in parallelo), oltre si aprirebbero connessioni usa e getta
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+# Timeout (connessione, lettura) in secondi per host: la connessione fallisce presto,
+# la lettura attende quanto serve all'API (Gemini è la più lenta)
+DEFAULT_TIMEOUT = (3.05, 30)
+HOST_TIMEOUTS = {
+    "google.serper.dev": (3.05, float(os.getenv("SERPER_READ_TIMEOUT", "15"))),
+    "generativelanguage.googleapis.com": (3.05, float(os.getenv("GEMINI_READ_TIMEOUT", "30"))),
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Sessione HTTP condivisa dal processo, con pool di connessioni keep-alive: le chiamate
+    successive verso lo stesso host riusano la connessione TCP+TLS già aperta.
+    Il pool di urllib3 è thread-safe; i cookie sono disabilitati perché la sessione
+    è condivisa tra richieste e sessioni diverse.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                logger.info(f"Sessione HTTP condivisa creata (pool {HTTP_POOL_SIZE} connessioni per host)")
+                _session = session
+    return _session
+
+
+def timeout_for(url: str):
+    """Timeout (connessione, lettura) configurato per l'host dell'URL"""
+    return HOST_TIMEOUTS.get(urlparse(url).hostname, DEFAULT_TIMEOUT)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """POST sulla sessione condivisa, con il timeout dell'host se non indicato"""
+    kwargs.setdefault("timeout", timeout_for(url))
+    return get_session().post(url, **kwargs)
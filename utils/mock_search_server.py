@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Server HTTP locale che imita le API Serper e Gemini usate dalla deep search, per provare
+e misurare il client HTTP senza rete né chiavi.
+
+Il server parla HTTP/1.1 con keep-alive e conta le connessioni aperte (GET /stats), così
+il benchmark può verificare quante strette di mano fa il client. Il costo di una stretta
+di mano reale (TCP+TLS verso un host remoto) si simula con --connect-delay-ms, applicato
+una volta per ogni nuova connessione; --latency-ms aggiunge un ritardo a ogni risposta.
+
+Uso:
+    python -m utils.mock_search_server --port 8765 --connect-delay-ms 80
+    SERPER_URL=http://127.0.0.1:8765/search GEMINI_BASE_URL=http://127.0.0.1:8765/v1beta streamlit run dash.py
+
+Con --certfile/--keyfile il server risponde in HTTPS.
+"""
+import re
+import ssl
+import json
+import time
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+_REQUEST_RE = re.compile(r"^Richiesta (\d+): locale (.+?), città (.+?), date: (.+)$", re.MULTILINE)
+_URL_RE = re.compile(r"^\s+(https?://\S+)$", re.MULTILINE)
+
+
+class MockSearchServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer con contatori di connessioni e richieste"""
+
+    daemon_threads = True
+
+    def __init__(self, address, connect_delay: float = 0.0, latency: float = 0.0):
+        super().__init__(address, _Handler)
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+
+    def count(self, connection: bool = False):
+        with self._lock:
+            if connection:
+                self.connections += 1
+            else:
+                self.requests += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.connections = 0
+            self.requests = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"connections": self.connections, "requests": self.requests}
+
+    @property
+    def base_url(self) -> str:
+        scheme = "https" if isinstance(self.socket, ssl.SSLSocket) else "http"
+        host, port = self.server_address[:2]
+        return f"{scheme}://{host}:{port}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1: la connessione resta aperta tra una richiesta e l'altra
+    protocol_version = "HTTP/1.1"
+    # Intestazioni e corpo sono scritti separatamente: senza TCP_NODELAY Nagle e l'ACK
+    # ritardato aggiungerebbero ~40 ms a ogni risposta sulla connessione riusata
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        # Un handler per connessione: qui si paga (e si conta) la stretta di mano
+        self.server.count(connection=True)
+        if self.server.connect_delay:
+            time.sleep(self.server.connect_delay)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, data, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(self.server.stats())
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json({"error": "invalid json"}, 400)
+            return
+
+        self.server.count()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.path.split("?")[0] == "/search":
+            self._send_json(_search_response(payload))
+        elif ":generateContent" in self.path:
+            self._send_json(_gemini_response(payload))
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+
+def _search_response(payload: dict) -> dict:
+    """Risultati organici nel formato Serper"""
+    q = payload.get("q", "")
+    num = int(payload.get("num", 5))
+    return {
+        "searchParameters": {"q": q, "num": num},
+        "organic": [
+            {
+                "title": f"{q} - risultato {i}",
+                "link": f"https://example.com/eventi/{i}",
+                "snippet": f"Programma eventi: {q}",
+                "position": i,
+            }
+            for i in range(1, num + 1)
+        ],
+    }
+
+
+def _gemini_response(payload: dict) -> dict:
+    """
+    Risposta generateContent: per un prompt batch un array con un verdetto per ogni
+    data di ogni richiesta, per un prompt singolo un solo verdetto.
+    """
+    text = payload["contents"][0]["parts"][0]["text"]
+    evidence = _URL_RE.findall(text)[:1]
+    requests_found = _REQUEST_RE.findall(text)
+    if requests_found:
+        verdicts = [
+            {"id": int(n), "data": d.strip(), "exists": True, "confidence": 0.9, "evidence": evidence}
+            for n, _, _, dates in requests_found
+            for d in dates.split(";")
+        ]
+    else:
+        verdicts = {"exists": True, "confidence": 0.9, "evidence": evidence}
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": json.dumps(verdicts, ensure_ascii=False)}]},
+            "finishReason": "STOP",
+        }]
+    }
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, connect_delay: float = 0.0, latency: float = 0.0,
+                 certfile: str = None, keyfile: str = None) -> MockSearchServer:
+    """Avvia il server in un thread daemon (porta 0: porta libera scelta dal sistema)"""
+    server = MockSearchServer((host, port), connect_delay=connect_delay, latency=latency)
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        # La stretta di mano TLS avviene nel thread della connessione, non nel ciclo di accept
+        server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+    threading.Thread(target=server.serve_forever, name="mock-search-server", daemon=True).start()
+    logger.info(f"Server di prova in ascolto su {server.base_url}")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--connect-delay-ms", type=float, default=0.0,
+                        help="Ritardo per ogni nuova connessione (simula TCP+TLS verso un host remoto)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Ritardo per ogni risposta")
+    parser.add_argument("--certfile", help="Certificato per servire in HTTPS")
+    parser.add_argument("--keyfile", help="Chiave privata del certificato")
+    args = parser.parse_args()
+
+    server = start_server(args.host, args.port, args.connect_delay_ms / 1000, args.latency_ms / 1000,
+                          args.certfile, args.keyfile)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
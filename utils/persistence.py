@@ -4,7 +4,12 @@ import logging
 from typing import Optional
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from dotenv import load_dotenv
+from utils.dataset_store import get_dataset_store
+from utils.schema import LOCALI_SCHEMA, SCHEMA_VERSION, apply_schema, concat_frames
+from utils.venues import assign_venue_ids
 
 load_dotenv()
 
@@ -13,11 +18,25 @@ logging.basicConfig(level=logging.INFO)
 
 DATA_DIR = os.getenv("DATA_DIR", "/app/data")
 LOCALI_CSV_DIR = os.getenv("LOCALI_CSV_DIR", DATA_DIR)
+LOCALI_CACHE_DIR = os.getenv("LOCALI_CACHE_DIR", os.path.join(DATA_DIR, "cache", "locali"))
 logger.info(f"DATA_DIR impostato a: {DATA_DIR}")
 logger.info(f"LOCALI_CSV_DIR impostato a: {LOCALI_CSV_DIR}")
+logger.info(f"LOCALI_CACHE_DIR impostato a: {LOCALI_CACHE_DIR}")
+
+# Chiavi dei metadati Parquet usate per invalidare la cache quando cambia il CSV sorgente
+_META_SOURCE_MTIME = b"licenselens.source_mtime_ns"
+_META_SOURCE_SIZE = b"licenselens.source_size"
+_META_SCHEMA_VERSION = b"licenselens.schema_version"
+
+def _read_geojson(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-@st.cache_data
 def load_geojson(path: Optional[str] = None) -> Optional[dict]:
+    """
+    GeoJSON condiviso tra le sessioni: il dizionario restituito non va modificato
+    (folium aggiunge solo gli "id" mancanti alle feature, in modo idempotente).
+    """
     logger.info("Caricamento GeoJSON")
     if path is None:
         path = os.path.join(DATA_DIR, "geo", "seprag.geojson")
@@ -29,8 +48,7 @@ def load_geojson(path: Optional[str] = None) -> Optional[dict]:
         return None
 
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            geojson_data = json.load(f)
+        geojson_data = get_dataset_store().get(("geojson", path), source_signature(path), lambda: _read_geojson(path))
         logger.info("GeoJSON caricato correttamente")
         return geojson_data
     except Exception as e:
@@ -50,8 +68,83 @@ def list_available_cities() -> list:
         logger.exception(f"Errore durante listing città: {e}")
         return []
 
-@st.cache_data
+def source_signature(path: str) -> tuple:
+    """Firma del file sorgente (mtime in ns, dimensione): fa da versione per cache e store"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def _signature_metadata(signature: tuple) -> dict:
+    mtime_ns, size = signature
+    return {
+        _META_SOURCE_MTIME: str(mtime_ns).encode(),
+        _META_SOURCE_SIZE: str(size).encode(),
+        _META_SCHEMA_VERSION: str(SCHEMA_VERSION).encode(),
+    }
+
+def read_parquet_cache(cache_path: str, signature: tuple) -> Optional[pd.DataFrame]:
+    """Legge il frame già pulito dalla cache Parquet se la firma coincide con il CSV"""
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        metadata = pq.read_schema(cache_path).metadata or {}
+        if any(metadata.get(k) != v for k, v in _signature_metadata(signature).items()):
+            logger.info(f"Cache Parquet obsoleta: {cache_path}")
+            return None
+        return pd.read_parquet(cache_path)
+    except Exception as e:
+        logger.warning(f"Errore lettura cache Parquet {cache_path}: {e}")
+        return None
+
+def write_parquet_cache(cache_path: str, df: pd.DataFrame, signature: tuple):
+    """Scrive il frame pulito in Parquet in modo atomico, con la firma del CSV nei metadati"""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **_signature_metadata(signature)})
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, cache_path)
+        logger.info(f"Cache Parquet aggiornata: {cache_path}")
+    except Exception as e:
+        logger.warning(f"Errore scrittura cache Parquet {cache_path}: {e}")
+
+def _clean_locali_frame(df: pd.DataFrame, city: str) -> pd.DataFrame:
+    """Pulizia del CSV Locali: coordinate valide e tipi compatti dallo schema dichiarato"""
+    df["CITY"] = city
+
+    for col in ["latitudine", "longitudine"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    df = df.dropna(subset=["latitudine", "longitudine"]).query(
+        "latitudine!=0 & longitudine!=0"
+    )
+
+    return apply_schema(df.reset_index(drop=True), LOCALI_SCHEMA, month_columns=True)
+
+def _load_csv_city(city: str, path: str, signature: tuple) -> pd.DataFrame:
+    cache_path = os.path.join(LOCALI_CACHE_DIR, f"Locali_{city}.parquet")
+
+    df = read_parquet_cache(cache_path, signature)
+    if df is not None:
+        logger.info(f"Locali caricati da cache Parquet: {city}, righe: {len(df)}")
+        # Parquet conserva come dizionario solo le categoriche testuali
+        df = apply_schema(df, LOCALI_SCHEMA, month_columns=True)
+    else:
+        df = pd.read_csv(path)
+        logger.info(f"CSV caricato: {city}, righe: {len(df)}")
+        df = _clean_locali_frame(df, city)
+        write_parquet_cache(cache_path, df, signature)
+
+    # ID interi dei locali dall'anagrafica (la città del file fa da sede, come per gli Eventi)
+    return assign_venue_ids(df, sede_column="CITY")
+
 def load_csv_city(city: str) -> pd.DataFrame:
+    """
+    Locali della città dal DatasetStore condiviso. Restituisce una vista senza copia:
+    le modifiche restano locali al chiamante grazie al copy-on-write.
+    """
     logger.info(f"Caricamento CSV per città: {city}")
     path = os.path.join(LOCALI_CSV_DIR, f"Locali_{city}.csv")
     logger.debug(f"Percorso CSV: {path}")
@@ -62,31 +155,28 @@ def load_csv_city(city: str) -> pd.DataFrame:
         return pd.DataFrame()
 
     try:
-        df = pd.read_csv(path)
-        df["CITY"] = city
-        logger.info(f"CSV caricato: {city}, righe: {len(df)}")
-
-        for col in ["latitudine", "longitudine"]:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-
-        df = df.dropna(subset=["latitudine", "longitudine"]).query(
-            "latitudine!=0 & longitudine!=0"
-        )
-
-        for c in ["events_total", "pct_last6m", "peer_comp", "priority_score"]:
-            if c in df.columns:
-                df[c] = pd.to_numeric(df[c], errors="coerce")
-
-        return df
+        signature = source_signature(path)
+        df = get_dataset_store().get(("locali", city), signature, lambda: _load_csv_city(city, path, signature))
+        return df.copy(deep=False)
     except Exception as e:
         logger.exception(f"Errore caricamento CSV città {city}: {e}")
         return pd.DataFrame()
 
-@st.cache_data
+def _load_locali_data(cities: list) -> pd.DataFrame:
+    df_cities = []
+    for city in cities:
+        df_city = load_csv_city(city)
+        if not df_city.empty:
+            df_cities.append(df_city)
+
+    if not df_cities:
+        return pd.DataFrame()
+
+    logger.info(f"Dati caricati per {len(df_cities)} città")
+    return concat_frames(df_cities)
+
 def load_locali_data() -> pd.DataFrame:
     logger.info("Caricamento dati di tutti i locali")
-    df_cities = []
     cities = list_available_cities()
 
     if not cities:
@@ -94,15 +184,17 @@ def load_locali_data() -> pd.DataFrame:
         logger.warning("Nessuna città disponibile")
         return pd.DataFrame()
 
-    for city in cities:
-        df_city = load_csv_city(city)
-        if not df_city.empty:
-            df_cities.append(df_city)
+    # La versione del frame aggregato è la combinazione delle versioni dei singoli CSV
+    signature = tuple(
+        (city, source_signature(path))
+        for city in cities
+        if os.path.exists(path := os.path.join(LOCALI_CSV_DIR, f"Locali_{city}.csv"))
+    )
+    df = get_dataset_store().get(("locali_all",), signature, lambda: _load_locali_data(cities))
 
-    if not df_cities:
+    if df.empty:
         st.error("⚠️ Nessun file trovato")
         logger.error("Nessun file CSV caricato correttamente")
         return pd.DataFrame()
 
-    logger.info(f"Dati caricati per {len(df_cities)} città")
-    return pd.concat(df_cities, ignore_index=True)
+    return df.copy(deep=False)
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Chi sta chiedendo i token (es. la sessione Streamlit): le code dei diversi owner sono
+# servite a turno, così un utente con molte richieste non blocca gli altri
+QUEUE_OWNER = ContextVar("rate_limit_owner", default=None)
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe per le quote delle API esterne (richieste al minuto),
+    condiviso da tutte le sessioni del processo.
+
+    Le richieste di token entrano in una coda per owner (QUEUE_OWNER); un thread di
+    dispatch consegna i token al ritmo della quota, servendo le code a turno (round robin).
+    Con richieste sempre in coda il ritmo coincide con la quota invece di approssimarla
+    con sleep fissi. Lo stesso secchio può essere usato da thread e event loop diversi.
+
+    Il ritmo è adattivo: una risposta 429 (penalize) dimezza il ritmo corrente e sospende
+    la consegna per il Retry-After indicato; ogni successo (reward) lo riporta
+    gradualmente verso la quota configurata.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, burst: int = 1,
+                 min_rate_per_minute: Optional[float] = None):
+        if rate_per_minute <= 0:
+            raise ValueError(f"Quota non valida per {name}: {rate_per_minute} RPM")
+        self.name = name
+        self.base_rate = rate_per_minute / 60.0
+        self.rate = self.base_rate
+        self.min_rate = (min_rate_per_minute or rate_per_minute / 8) / 60.0
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._queues = OrderedDict()
+        self._cond = threading.Condition()
+        self._thread = None
+        logger.info(f"Limiter {name}: {rate_per_minute} RPM, burst {self.burst}")
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _submit(self) -> Future:
+        """Accoda una richiesta di token dell'owner corrente"""
+        future = Future()
+        with self._cond:
+            self._queues.setdefault(QUEUE_OWNER.get(), deque()).append(future)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name=f"limiter-{self.name}", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def _dispatch(self):
+        """Consegna i token in ordine round robin tra gli owner, al ritmo corrente"""
+        with self._cond:
+            while True:
+                if not self._queues:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                self._refill(now)
+                delay = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+
+                owner, queue = next(iter(self._queues.items()))
+                future = queue.popleft()
+                if queue:
+                    self._queues.move_to_end(owner)
+                else:
+                    del self._queues[owner]
+                # Le attese annullate non consumano token
+                if future.set_running_or_notify_cancel():
+                    self._tokens -= 1
+                    future.set_result(None)
+
+    def acquire(self):
+        """Attende il proprio turno (versione bloccante, per i thread)"""
+        self._submit().result()
+
+    async def wait(self):
+        """Attende il proprio turno senza bloccare l'event loop"""
+        await asyncio.wrap_future(self._submit())
+
+    def penalize(self, retry_after: Optional[float] = None):
+        """Risposta 429: dimezza il ritmo e sospende la consegna per retry_after secondi"""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self._blocked_until = max(self._blocked_until, now + pause)
+            self._tokens = min(self._tokens, 0.0)
+            self._cond.notify()
+        logger.warning(f"Limiter {self.name}: 429, pausa {pause:.1f}s, ritmo {self.rate * 60:.1f} RPM")
+
+    def reward(self):
+        """Richiesta andata a buon fine: il ritmo risale verso la quota configurata"""
+        if self.rate >= self.base_rate:
+            return
+        with self._cond:
+            self._refill(time.monotonic())
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 20)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "rpm": round(self.rate * 60, 1),
+                "quota_rpm": round(self.base_rate * 60, 1),
+                "queued": sum(len(q) for q in self._queues.values()),
+                "owners": len(self._queues),
+                "paused_for": round(max(0.0, self._blocked_until - time.monotonic()), 1),
+            }
+
+
+def retry_after_seconds(response) -> Optional[float]:
+    """
+    Attesa suggerita da una risposta 429: header Retry-After (secondi o data HTTP)
+    oppure retryDelay nei dettagli dell'errore JSON delle API Google.
+    """
+    value = response.headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    try:
+        for detail in response.json().get("error", {}).get("details", []):
+            delay = detail.get("retryDelay")
+            if isinstance(delay, str) and delay.endswith("s"):
+                return max(0.0, float(delay[:-1]))
+    except (ValueError, AttributeError):
+        pass
+    return None
@@ -0,0 +1,285 @@
+import calendar
+import datetime
+import logging
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+from utils import events_store
+from utils.dataset_store import get_dataset_store
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Attributi degli eventi che identificano un gruppo dell'indice: oltre al locale (ID
+# intero dell'anagrafica, vedi utils.venues) servono seprag_cod e locale_genere, su cui
+# i filtri delle tab lavorano per evento
+GROUP_COLUMNS = ["sede", "venue_id", "seprag_cod", "locale_genere"]
+# Attributi dei gruppi ricavati dal primo evento, solo per la visualizzazione
+GROUP_ATTRIBUTES = ["des_locale"]
+
+# Giorni per anno sul calendario bisestile di events_store.day_of_year
+DAYS_PER_YEAR = 366
+# Oltre questa ampiezza le finestre di anni consecutivi si sovrapporrebbero
+MAX_WINDOW = 120
+
+# Numero di bit a 1 per ogni valore di un byte
+_POPCOUNT_8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    """Numero di bit a 1 di ciascuna maschera uint64"""
+    masks = np.ascontiguousarray(masks, dtype=np.uint64)
+    return _POPCOUNT_8[masks.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def target_date(anno: int, mese: int, giorno: int, riferimento: Optional[datetime.date] = None):
+    """
+    Data obiettivo dell'anno indicato: lo stesso giorno/mese oppure, con una data di
+    riferimento, lo stesso "n-esimo giorno della settimana" del mese (es. il primo
+    sabato). Se la quinta occorrenza non esiste si usa l'ultima del mese.
+    None se il giorno/mese non esiste in quell'anno (29 febbraio).
+    """
+    if riferimento is None:
+        try:
+            return datetime.date(anno, mese, giorno)
+        except ValueError:
+            return None
+
+    occorrenza = (riferimento.day - 1) // 7
+    primo = datetime.date(anno, riferimento.month, 1)
+    giorno = 1 + (riferimento.weekday() - primo.weekday()) % 7 + 7 * occorrenza
+    if giorno > calendar.monthrange(anno, riferimento.month)[1]:
+        giorno -= 7
+    return primo.replace(day=giorno)
+
+
+def reference_date(anno: int, mese: int, giorno: int) -> datetime.date:
+    """Giorno/mese nell'anno indicato, ripiegando sul 28 per le date invalide (29 febbraio)"""
+    return target_date(anno, mese, giorno) or datetime.date(anno, mese, min(giorno, 28))
+
+
+def _ranges(start: np.ndarray, stop: np.ndarray) -> np.ndarray:
+    """Concatenazione degli intervalli [start, stop) senza cicli Python"""
+    lengths = stop - start
+    return np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(start, lengths)
+
+
+def _key_codes(series: pd.Series) -> np.ndarray:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy()
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return series.to_numpy()
+    return pd.factorize(series)[0]
+
+
+class RecurrenceIndex:
+    """
+    Indice delle ricorrenze: per ogni giorno dell'anno (calendario bisestile, vedi
+    events_store.day_of_year) e per ogni gruppo (sede, locale, seprag, genere) la
+    maschera di bit degli anni con almeno un evento e il numero di eventi per anno.
+
+    Il bit i delle maschere corrisponde all'anno self.years[i]. Il calcolo dello
+    score per una data diventa una ricerca binaria sul giorno e un popcount.
+    """
+
+    def __init__(self, events: pd.DataFrame):
+        if events.empty:
+            events = pd.DataFrame({"anno": pd.Series(dtype="int16"), "giorno_anno": pd.Series(dtype="int16")})
+        self.events = events
+        self.years = np.sort(events["anno"].unique()).astype(int)
+        if len(self.years) > 64:
+            raise ValueError("RecurrenceIndex supporta al massimo 64 anni di storico")
+        # Primo giorno (ordinale) e bisestilità di ogni anno, per la linea del tempo delle finestre
+        self._year_start = np.array([datetime.date(y, 1, 1).toordinal() for y in self.years], dtype=np.int64)
+        self._leap = np.array([calendar.isleap(y) for y in self.years], dtype=bool)
+
+        key_columns = [c for c in GROUP_COLUMNS if c in events.columns]
+        giorno_anno = events["giorno_anno"].to_numpy()
+        positions = np.flatnonzero(giorno_anno > 0)
+
+        # Ordinamento per (giorno_anno, chiavi del gruppo); lexsort è stabile, quindi
+        # dentro ogni gruppo gli eventi restano nell'ordine del frame di origine
+        sort_keys = [_key_codes(events[c])[positions] for c in reversed(key_columns)]
+        sort_keys.append(giorno_anno[positions])
+        self.order = positions[np.lexsort(sort_keys)]
+
+        sorted_keys = [_key_codes(events[c])[self.order] for c in key_columns] + [giorno_anno[self.order]]
+        changed = np.zeros(len(self.order), dtype=bool)
+        if len(self.order):
+            changed[0] = True
+            for k in sorted_keys:
+                changed[1:] |= k[1:] != k[:-1]
+        group_start = np.flatnonzero(changed)
+        group_stop = np.r_[group_start[1:], len(self.order)]
+
+        # Anno (come indice di bit) e gruppo di ciascun evento ordinato
+        self.event_slot = np.searchsorted(self.years, events["anno"].to_numpy()[self.order]).astype(np.int8)
+        self.event_group = np.repeat(np.arange(len(group_start), dtype=np.int32), group_stop - group_start)
+
+        n_years = len(self.years)
+        counts = np.bincount(
+            self.event_group.astype(np.int64) * n_years + self.event_slot,
+            minlength=len(group_start) * n_years,
+        )
+        self.counts = counts.reshape(len(group_start), n_years).astype(np.uint16)
+
+        bits = np.left_shift(np.uint64(1), np.arange(n_years, dtype=np.uint64))
+        anni_mask = ((self.counts > 0).astype(np.uint64) * bits).sum(axis=1, dtype=np.uint64)
+
+        first = self.order[group_start]
+        self.groups = pd.DataFrame({
+            "giorno_anno": giorno_anno[first],
+            **{
+                c: events[c].iloc[first].reset_index(drop=True)
+                for c in key_columns + [a for a in GROUP_ATTRIBUTES if a in events.columns]
+            },
+            "start": group_start,
+            "stop": group_stop,
+            "anni_mask": anni_mask,
+        })
+        self._venue_index = None
+        logger.info(f"Indice ricorrenze costruito: {len(self.order)} eventi, {len(self.groups)} gruppi, anni {self.years.tolist()}")
+
+    def day_range(self, mese: int, giorno: int) -> slice:
+        """Intervallo di gruppi (righe di self.groups) del giorno/mese indicato"""
+        giorno_anno = int(events_store.day_of_year(mese, giorno))
+        keys = self.groups["giorno_anno"].to_numpy()
+        start, stop = np.searchsorted(keys, [giorno_anno, giorno_anno + 1])
+        return slice(int(start), int(stop))
+
+    def years_mask(self, years: Iterable[int]) -> np.uint64:
+        """Maschera di bit degli anni indicati (gli anni assenti dall'indice sono ignorati)"""
+        years = set(years)
+        mask = np.uint64(0)
+        for i, year in enumerate(self.years):
+            if year in years:
+                mask |= np.uint64(1) << np.uint64(i)
+        return mask
+
+    def targets(self, mese: int, giorno: int, oggi: datetime.date,
+                riferimento: Optional[datetime.date] = None) -> np.ndarray:
+        """
+        Giorno dell'anno obiettivo per ciascun anno dell'indice (0 se in quell'anno la
+        data non è ancora passata rispetto a oggi). Con riferimento la data obiettivo è
+        allineata al giorno della settimana (vedi target_date).
+        """
+        targets = np.zeros(len(self.years), dtype=np.int16)
+        for i, anno in enumerate(self.years):
+            data = target_date(anno, mese, giorno, riferimento) or reference_date(anno, mese, giorno)
+            if data > oggi:
+                continue
+            if riferimento is None:
+                targets[i] = events_store.day_of_year(mese, giorno)
+            else:
+                targets[i] = events_store.day_of_year(data.month, data.day)
+        return targets
+
+    def _timeline(self, slots, giorno_anno):
+        """
+        Posizione (ordinale del calendario reale) del giorno giorno_anno negli anni di indice
+        slots: negli anni non bisestili il 29/02 del calendario bisestile non esiste e i
+        giorni successivi slittano indietro di uno (il 29/02 cade sul 28/02, come in reference_date)
+        """
+        giorno_anno = np.asarray(giorno_anno, dtype=np.int64)
+        return self._year_start[slots] + giorno_anno - 1 - (~self._leap[slots] & (giorno_anno >= 60))
+
+    def window_cells(self, targets: np.ndarray, k: int, oggi: datetime.date):
+        """
+        Celle (gruppo, anno) con eventi passati entro ±k giorni dalla data obiettivo di un anno.
+
+        targets contiene il giorno dell'anno obiettivo per ciascun anno dell'indice (0 =
+        anno non considerato, vedi targets). Ritorna le righe dei gruppi candidati e una
+        matrice (righe x anni) con l'indice di bit dell'anno obiettivo nella cui finestra
+        cade ciascuna cella, -1 per le celle vuote, future o fuori finestra.
+
+        Le distanze si misurano sul calendario reale (vedi _timeline), quindi le finestre
+        attraversano il cambio d'anno (il 2 gennaio con k=3 include il 30 e il 31 dicembre
+        dell'anno prima) e, negli anni non bisestili, passano dal 28/02 all'1/03 senza il
+        giorno vuoto del 29/02. Ogni cella viene assegnata alla data obiettivo più vicina
+        con una ricerca binaria: il costo dipende dai gruppi candidati, non da k.
+        """
+        if not 0 <= k <= MAX_WINDOW:
+            raise ValueError(f"Finestra di {k} giorni non supportata (massimo {MAX_WINDOW})")
+
+        targets = np.asarray(targets, dtype=np.int64)
+        slots = np.flatnonzero(targets > 0)
+        if not len(slots):
+            return np.empty(0, dtype=np.int64), np.empty((0, len(self.years)), dtype=np.int8)
+
+        # Gruppi dei giorni coperti dalle finestre (a cavallo d'anno si riparte dall'1 gennaio),
+        # con un giorno in più per lato: negli anni non bisestili il 29/02 non occupa posto
+        giorni = np.unique((targets[slots, None] - 1 + np.arange(-k - 1, k + 2)) % DAYS_PER_YEAR + 1)
+        keys = self.groups["giorno_anno"].to_numpy()
+        rows = _ranges(np.searchsorted(keys, giorni, "left"), np.searchsorted(keys, giorni, "right"))
+        return rows, self.window_hits(rows, targets, k, oggi)
+
+    def window_hits(self, rows: np.ndarray, targets: np.ndarray, k: int, oggi: datetime.date) -> np.ndarray:
+        """Come window_cells, ma per righe dei gruppi già note (es. quelle di un locale)"""
+        targets = np.asarray(targets, dtype=np.int64)
+        slots = np.flatnonzero(targets > 0)
+        if not len(slots):
+            return np.full((len(rows), len(self.years)), -1, dtype=np.int8)
+        giorno_anno = self.groups["giorno_anno"].to_numpy()[rows].astype(np.int64)
+
+        # Posizione delle celle e delle date obiettivo sulla linea del tempo
+        centers = self._timeline(slots, targets[slots])
+        t = self._timeline(np.arange(len(self.years))[None, :], giorno_anno[:, None])
+        right = np.minimum(np.searchsorted(centers, t), len(centers) - 1)
+        left = np.maximum(right - 1, 0)
+        nearest = np.where(np.abs(t - centers[left]) <= np.abs(centers[right] - t), left, right)
+        hit = np.abs(t - centers[nearest]) <= k
+
+        # Solo eventi passati (data <= oggi)
+        oggi_giorno_anno = events_store.day_of_year(oggi.month, oggi.day)
+        past = (self.years < oggi.year)[None, :] | (
+            (self.years == oggi.year)[None, :] & (giorno_anno[:, None] <= oggi_giorno_anno)
+        )
+        hit &= past & (self.counts[rows] > 0)
+
+        return np.where(hit, slots[nearest], -1).astype(np.int8)
+
+    def _venue_lookup(self):
+        """
+        Righe dei gruppi ordinate per (venue_id, giorno_anno), costruite al primo uso.
+        L'indice è condiviso tra le sessioni: il risultato viene assegnato in un'unica tupla.
+        """
+        if self._venue_index is None:
+            venue_ids = self.groups["venue_id"].to_numpy()
+            order = np.argsort(venue_ids, kind="stable")
+            self._venue_index = (order, venue_ids[order])
+        return self._venue_index
+
+    def venue_rows(self, venue_id: int) -> np.ndarray:
+        """Righe dei gruppi di un locale (tutti i giorni, in ordine di giorno_anno)"""
+        if "venue_id" not in self.groups.columns:
+            return np.empty(0, dtype=np.int64)
+        order, keys = self._venue_lookup()
+        start, stop = np.searchsorted(keys, [venue_id, venue_id + 1])
+        return order[start:stop]
+
+    def group_events(self, group_rows: np.ndarray):
+        """
+        Eventi dei gruppi indicati (righe di self.groups): restituisce le posizioni nel
+        frame self.events, l'indice di bit dell'anno e, per ciascun evento, la posizione
+        del suo gruppo in group_rows.
+        """
+        start = self.groups["start"].to_numpy()[group_rows]
+        stop = self.groups["stop"].to_numpy()[group_rows]
+        owner = np.repeat(np.arange(len(group_rows)), stop - start)
+        idx = _ranges(start, stop)
+        return self.order[idx], self.event_slot[idx], owner
+
+    def mask_years(self, mask) -> list:
+        """Anni corrispondenti ai bit a 1 di una maschera"""
+        mask = int(mask)
+        return [int(y) for i, y in enumerate(self.years) if mask >> i & 1]
+
+
+def get_recurrence_index(sedi: Iterable[str]) -> RecurrenceIndex:
+    """Indice delle ricorrenze delle sedi, condiviso e ricostruito solo quando cambiano i dati eventi"""
+    sedi = sorted(sedi)
+    version = events_store.events_version(sedi)
+    return get_dataset_store().get(
+        ("recurrence_index", tuple(sedi)), version,
+        lambda: RecurrenceIndex(events_store.load_events(sedi)),
+    )
@@ -0,0 +1,145 @@
+import re
+import logging
+from typing import Iterable
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Versione dello schema: va incrementata a ogni modifica dei tipi, così le cache
+# su disco costruite con lo schema precedente vengono invalidate.
+SCHEMA_VERSION = 2
+
+# Colonne mensili "MM/YYYY" dei file Locali (conteggio eventi del mese)
+MONTH_COLUMN_PATTERN = re.compile(r"^\d{2}/\d{4}$")
+MONTH_COLUMN_DTYPE = "float32"
+
+LOCALI_SCHEMA = {
+    "CITY": "category",
+    "sede": "category",
+    "seprag_cod": "category",
+    "locale_genere": "category",
+    "comune": "category",
+    "des_locale": "category",
+    "indirizzo": "category",
+    "latitudine": "float32",
+    "longitudine": "float32",
+    "events_total": "float32",
+    "pct_last6m": "float32",
+    "peer_comp": "float32",
+    "priority_score": "float32",
+    "fascia_cell": "Int8",
+    "priority": "Int8",
+    # Assegnato al caricamento dall'anagrafica dei locali (utils.venues)
+    "venue_id": "int32",
+}
+
+EVENTI_SCHEMA = {
+    "sede": "category",
+    "seprag_cod": "category",
+    "locale_genere": "category",
+    "comune": "category",
+    "des_locale": "category",
+    "indirizzo": "category",
+    "anno": "int16",
+    "mese": "Int8",
+    "giorno": "Int8",
+    "giorno_anno": "int16",
+    "venue_id": "int32",
+}
+
+
+def _coerce(series: pd.Series, dtype: str) -> pd.Series:
+    if dtype == "category":
+        return series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype("category")
+    if series.dtype == dtype:
+        return series
+    return pd.to_numeric(series, errors="coerce").astype(dtype)
+
+
+def apply_schema(df: pd.DataFrame, schema: dict, month_columns: bool = False) -> pd.DataFrame:
+    """
+    Converte le colonne presenti in df ai tipi dichiarati nello schema.
+    Le colonne assenti vengono ignorate; se una conversione fallisce la colonna
+    resta invariata e l'errore viene registrato nei log.
+    """
+    dtypes = {col: dtype for col, dtype in schema.items() if col in df.columns}
+    if month_columns:
+        dtypes.update({
+            col: MONTH_COLUMN_DTYPE for col in df.columns
+            if isinstance(col, str) and MONTH_COLUMN_PATTERN.match(col)
+        })
+
+    converted = {}
+    for col, dtype in dtypes.items():
+        try:
+            converted[col] = _coerce(df[col], dtype)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Impossibile convertire la colonna {col} in {dtype}: {e}")
+
+    return df.assign(**converted) if converted else df
+
+
+def _codes(series: pd.Series, dtype: pd.CategoricalDtype) -> np.ndarray:
+    """Codici di una colonna rispetto alle categorie (più ampie) di dtype; -1 per i mancanti"""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return dtype.categories.get_indexer(series)
+
+    code_map = np.append(dtype.categories.get_indexer(series.cat.categories), -1)
+    return code_map[series.cat.codes.to_numpy()]
+
+
+def concat_frames(frames: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """
+    pd.concat che preserva le colonne categoriche: unisce le categorie dei singoli
+    frame prima della concatenazione (altrimenti pandas ripiega su object).
+    """
+    frames = list(frames)
+    cat_dtypes = {}
+    for f in frames:
+        for col in f.columns:
+            if col not in cat_dtypes and isinstance(f[col].dtype, pd.CategoricalDtype):
+                parts = [
+                    g[col].cat.categories for g in frames
+                    if col in g.columns and isinstance(g[col].dtype, pd.CategoricalDtype)
+                ]
+                cat_dtypes[col] = pd.CategoricalDtype(parts[0].append(parts[1:]).unique())
+
+    if not cat_dtypes:
+        return pd.concat(frames, ignore_index=True)
+
+    # Si concatenano i soli codici interi e le categoriche vengono ricostruite una volta:
+    # pandas altrimenti confronta (ricalcolandone l'hash) le categorie di ogni coppia di frame
+    coded = [
+        f.assign(**{col: _codes(f[col], dtype) for col, dtype in cat_dtypes.items() if col in f.columns})
+        for f in frames
+    ]
+    df = pd.concat(coded, ignore_index=True)
+    return df.assign(**{
+        col: pd.Categorical.from_codes(df[col].fillna(-1).to_numpy(dtype=np.int64), dtype=dtype)
+        for col, dtype in cat_dtypes.items()
+    })
+
+
+def genere_category(genere: pd.Series, generi_prioritari: Iterable[str]) -> pd.Series:
+    """
+    Categoria di genere: il genere stesso se prioritario, altrimenti "Altro"
+    (anche per i valori mancanti). Per le colonne categoriche lavora sulle
+    sole categorie invece che riga per riga.
+    """
+    generi_prioritari = set(generi_prioritari)
+    if not isinstance(genere.dtype, pd.CategoricalDtype):
+        genere = genere.astype("category")
+
+    mapped = [c if c in generi_prioritari else "Altro" for c in genere.cat.categories]
+    categories = pd.Index(mapped + ["Altro"]).unique()
+    code_map = np.append(categories.get_indexer(mapped), categories.get_loc("Altro"))
+
+    # I codici -1 (valori mancanti) puntano all'ultima voce di code_map, cioè "Altro"
+    codes = code_map[genere.cat.codes.to_numpy()]
+    return pd.Series(
+        pd.Categorical.from_codes(codes, categories=categories),
+        index=genere.index,
+        name=genere.name,
+    )
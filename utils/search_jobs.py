@@ -0,0 +1,403 @@
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import datetime
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Optional
+import pandas as pd
+from dotenv import load_dotenv
+from utils.deep_search import CIRCUIT_RESET_SECONDS, cache_stats, submit_events_range
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+# Coda persistente delle ricerche eventi: sopravvive a rerun, disconnessioni e riavvii
+JOBS_PATH = os.getenv("DEEP_SEARCH_JOBS_PATH", "data/cache/jobs.sqlite")
+# Ricerche eseguite in parallelo dal processo (le chiamate restano limitate dalle quote)
+JOB_WORKERS = int(os.getenv("DEEP_SEARCH_JOB_WORKERS", "2"))
+# Un job in esecuzione senza rinnovo del lease per questo tempo (processo terminato)
+# torna disponibile e viene ripreso da un altro worker, anche di un'altra replica
+JOB_LEASE_SECONDS = float(os.getenv("DEEP_SEARCH_JOB_LEASE_SECONDS", "60"))
+# Tentativi di un job con verdetti non ottenuti (servizio non disponibile) prima di chiuderlo
+JOB_MAX_ATTEMPTS = int(os.getenv("DEEP_SEARCH_JOB_MAX_ATTEMPTS", "5"))
+JOB_RETENTION_HOURS = float(os.getenv("DEEP_SEARCH_JOB_RETENTION_HOURS", "72"))
+# Cartella dei CSV con i link degli eventi trovati, scritti dal worker a fine job
+EXPORT_DIR = os.getenv("EVENTS_EXPORT_DIR", "data/export")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+ACTIVE = (QUEUED, RUNNING)
+
+
+class JobStore:
+    """
+    Job di ricerca eventi su SQLite (WAL): un job è una griglia locali x giorni, ogni
+    coppia (locale, giorno) è un task con il proprio verdetto salvato appena ottenuto.
+    Un job interrotto riprende dai soli task senza verdetto.
+
+    I worker prendono i job con un lease a tempo rinnovato durante l'esecuzione: lo stesso
+    file può essere condiviso da più processi dell'app.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, owner TEXT, status TEXT NOT NULL,"
+                " venues TEXT NOT NULL, days TEXT NOT NULL, meta TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_until REAL NOT NULL DEFAULT 0,"
+                " available_at REAL NOT NULL DEFAULT 0, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, created_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " job_id TEXT NOT NULL, venue_idx INTEGER NOT NULL, day TEXT NOT NULL,"
+                " result TEXT, done_at REAL, PRIMARY KEY (job_id, venue_idx, day))"
+            )
+        logger.info(f"Coda ricerche eventi SQLite: {path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def create(self, venues: list, days: list, owner=None, meta: Optional[dict] = None) -> str:
+        """Nuovo job in coda: venues sono dict con almeno des_locale e comune"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, owner, status, venues, days, meta, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, owner, QUEUED, json.dumps(venues, ensure_ascii=False),
+                 json.dumps(days, ensure_ascii=False), json.dumps(meta or {}, ensure_ascii=False), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO tasks (job_id, venue_idx, day) VALUES (?, ?, ?)",
+                [(job_id, i, day) for i in range(len(venues)) for day in days],
+            )
+        logger.info(f"Job {job_id} in coda: {len(venues)} locali x {len(days)} giorni")
+        return job_id
+
+    def claim(self, worker: str) -> Optional[dict]:
+        """Prende il job disponibile più vecchio (in coda o con lease scaduto)"""
+        now = time.time()
+        conn = self._connection()
+        # Transazione con lock di scrittura preso subito: due worker (anche di processi
+        # diversi) non possono scegliere lo stesso job
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?)"
+                " ORDER BY created_at LIMIT 1",
+                (QUEUED, now, RUNNING, now),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?"
+                    " WHERE id = ?",
+                    (RUNNING, worker, now + JOB_LEASE_SECONDS, now, row[0]),
+                )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return self.job(row[0]) if row is not None else None
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        """Rinnova il lease; False se il job è stato annullato o preso da un altro worker"""
+        now = time.time()
+        with self._connection() as conn:
+            return conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (now + JOB_LEASE_SECONDS, now, job_id, worker, RUNNING),
+            ).rowcount == 1
+
+    def release(self, job_id: str, worker: str, status: str, delay: float = 0.0):
+        """Chiude il job (done) o lo rimette in coda (queued) dopo delay secondi"""
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, lease_until = 0, available_at = ?, updated_at = ?"
+                " WHERE id = ? AND worker = ? AND status = ?",
+                (status, now + delay, now, job_id, worker, RUNNING),
+            )
+
+    def update_meta(self, job_id: str, values: dict):
+        """Aggiunge o sostituisce chiavi nei metadati del job"""
+        with self._connection() as conn:
+            row = conn.execute("SELECT meta FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET meta = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps({**json.loads(row[0]), **values}, ensure_ascii=False), time.time(), job_id),
+                )
+
+    def cancel(self, job_id: str):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                (CANCELLED, time.time(), job_id, *ACTIVE),
+            )
+
+    def checkpoint(self, job_id: str, venue_idx: int, day: str, result: dict):
+        """Salva il verdetto di un task: alla ripresa non verrà rifatto"""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE tasks SET result = ?, done_at = ? WHERE job_id = ? AND venue_idx = ? AND day = ?",
+                (json.dumps(result, ensure_ascii=False), time.time(), job_id, venue_idx, day),
+            )
+
+    def pending(self, job_id: str) -> list:
+        """Task ancora senza verdetto: (indice locale, giorno)"""
+        return self._connection().execute(
+            "SELECT venue_idx, day FROM tasks WHERE job_id = ? AND result IS NULL ORDER BY venue_idx", (job_id,)
+        ).fetchall()
+
+    def job(self, job_id: str) -> Optional[dict]:
+        """Stato del job con avanzamento (task completati su totali)"""
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT id, owner, status, venues, days, meta, attempts, created_at, updated_at FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        done, total = conn.execute(
+            "SELECT COUNT(result), COUNT(*) FROM tasks WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return {
+            "id": row[0], "owner": row[1], "status": row[2], "venues": json.loads(row[3]),
+            "days": json.loads(row[4]), "meta": json.loads(row[5]), "attempts": row[6],
+            "created_at": row[7], "updated_at": row[8], "done": done, "total": total,
+        }
+
+    def results(self, job_id: str) -> dict:
+        """Verdetti ottenuti finora: (indice locale, giorno) -> esito"""
+        rows = self._connection().execute(
+            "SELECT venue_idx, day, result FROM tasks WHERE job_id = ? AND result IS NOT NULL", (job_id,)
+        ).fetchall()
+        return {(i, day): json.loads(result) for i, day, result in rows}
+
+    def latest(self, owner) -> Optional[str]:
+        """Ultimo job del richiedente"""
+        row = self._connection().execute(
+            "SELECT id FROM jobs WHERE owner = ? ORDER BY created_at DESC LIMIT 1", (owner,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def purge(self) -> int:
+        """Elimina i job conclusi più vecchi di JOB_RETENTION_HOURS"""
+        cutoff = time.time() - JOB_RETENTION_HOURS * 3600
+        with self._connection() as conn:
+            conn.execute(
+                "DELETE FROM tasks WHERE job_id IN (SELECT id FROM jobs WHERE updated_at < ? AND status NOT IN (?, ?))",
+                (cutoff, *ACTIVE),
+            )
+            removed = conn.execute(
+                "DELETE FROM jobs WHERE updated_at < ? AND status NOT IN (?, ?)", (cutoff, *ACTIVE)
+            ).rowcount
+        if removed:
+            logger.info(f"Coda ricerche: eliminati {removed} job conclusi")
+        return removed
+
+
+# Coda aperta al primo uso (_jobs): importare il modulo non crea il file SQLite
+_store = None
+_store_lock = threading.Lock()
+_workers = []
+_workers_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def _jobs() -> JobStore:
+    """Coda dei job del processo, aperta al primo uso"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = JobStore(JOBS_PATH)
+    return _store
+
+
+def _export_csv(job: dict) -> Optional[dict]:
+    """
+    CSV con i link degli eventi trovati da un job concluso, scritto una sola volta dal
+    worker: {"path", "rows"} o None. Il nome riporta date, generi e comuni del meta del job.
+    """
+    results = _jobs().results(job["id"])
+    meta = job["meta"]
+    selected_dates = [datetime.date.fromisoformat(d) for d in meta.get("dates", [])]
+    csv_results = []
+    for d, day in zip(selected_dates, job["days"]):
+        for i, venue in enumerate(job["venues"]):
+            result = results.get((i, day))
+            if not result or not result.get("evidence"):
+                continue
+            for link in result["evidence"]:
+                csv_results.append({
+                    'locale': venue['des_locale'],
+                    'data_evento': d.strftime('%d/%m/%Y'),
+                    'link_evento': link.strip(),
+                    'indirizzo': venue.get('indirizzo', 'N/A')
+                })
+
+    if not csv_results or not selected_dates:
+        logger.info(f"Job {job['id']}: nessun evento con link trovato per l'export CSV")
+        return None
+
+    # Costruisci nome file con filtri applicati
+    date_range = f"{selected_dates[0].strftime('%Y%m%d')}-{selected_dates[-1].strftime('%Y%m%d')}" if len(selected_dates) > 1 else selected_dates[0].strftime('%Y%m%d')
+
+    # Formatta generi (max 3, sostituisce spazi e caratteri speciali)
+    def sanitize_filename(s):
+        """Rimuove caratteri non validi per nomi file"""
+        return re.sub(r'[^\w\s-]', '', s).replace(' ', '_')
+
+    selected_genres = meta.get("generi") or []
+    generi_str = "_".join([sanitize_filename(g) for g in selected_genres[:3]]) if selected_genres else "tutti"
+
+    # Formatta seprag (max 3, converti in stringa)
+    selected_comuni = meta.get("comuni") or []
+    seprag_str = "_".join([str(c) for c in selected_comuni[:3]]) if selected_comuni else "tutti"
+
+    csv_filename = os.path.join(EXPORT_DIR, f"eventi_trovati_{date_range}_{generi_str}_{seprag_str}.csv")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    pd.DataFrame(csv_results).to_csv(csv_filename, index=False, encoding='utf-8-sig')
+
+    logger.info(f"CSV esportato: {csv_filename} con {len(csv_results)} risultati")
+    return {"path": csv_filename, "rows": len(csv_results)}
+
+
+def _run_job(job: dict, worker: str):
+    """
+    Esegue i task senza verdetto del job sullo scheduler della deep search, salvando ogni
+    verdetto appena arriva. I verdetti non ottenuti per servizio non disponibile restano
+    da fare: il job torna in coda dopo il reset del circuito.
+    """
+    job_id = job["id"]
+    venues = job["venues"]
+    pending_days = {}
+    for venue_idx, day in _jobs().pending(job_id):
+        pending_days.setdefault(venue_idx, []).append(day)
+    logger.info(f"Job {job_id}: {sum(len(d) for d in pending_days.values())} task da verificare (tentativo {job['attempts']})")
+
+    # Locali con gli stessi giorni mancanti: una sola griglia (una ricerca per locale)
+    grids = {}
+    for venue_idx, days in pending_days.items():
+        grids.setdefault(tuple(days), []).append(venue_idx)
+    pending = {}
+    pipelines = []
+    for days, indexes in grids.items():
+        futures, pipeline = submit_events_range(
+            [(venues[i].get("des_locale", ""), venues[i].get("comune", "")) for i in indexes], list(days),
+            owner=job["owner"],
+        )
+        pipelines.append(pipeline)
+        for venue_idx, venue_futures in zip(indexes, futures):
+            for day, future in venue_futures.items():
+                pending[future] = (venue_idx, day)
+
+    unavailable = {}
+    while pending:
+        done, _ = wait(pending, timeout=JOB_LEASE_SECONDS / 3, return_when=FIRST_COMPLETED)
+        # Il lease si verifica prima di salvare: un job annullato non scrive altri verdetti
+        if not _jobs().renew(job_id, worker):
+            # Annullato o ripreso da un altro worker: le chiamate non ancora fatte si fermano
+            for pipeline in pipelines:
+                pipeline.cancel()
+            logger.info(f"Job {job_id} interrotto")
+            return
+        for future in done:
+            venue_idx, day = pending.pop(future)
+            result = future.result()
+            if result.get("circuit_open"):
+                unavailable[(venue_idx, day)] = result
+            else:
+                _jobs().checkpoint(job_id, venue_idx, day, result)
+
+    if unavailable and job["attempts"] < JOB_MAX_ATTEMPTS:
+        logger.warning(f"Job {job_id}: {len(unavailable)} verdetti non ottenuti, nuovo tentativo tra {CIRCUIT_RESET_SECONDS:.0f}s")
+        _jobs().release(job_id, worker, QUEUED, delay=CIRCUIT_RESET_SECONDS)
+        return
+    for (venue_idx, day), result in unavailable.items():
+        _jobs().checkpoint(job_id, venue_idx, day, result)
+    _jobs().update_meta(job_id, {"export": _export_csv(job)})
+    _jobs().release(job_id, worker, DONE)
+    logger.info(f"Job {job_id} completato, cache: {cache_stats()}")
+
+
+def _worker_loop(worker: str):
+    while True:
+        try:
+            job = _jobs().claim(worker)
+        except sqlite3.Error as e:
+            logger.warning(f"Errore lettura coda ricerche: {e}")
+            job = None
+        if job is None:
+            _wakeup.wait(timeout=5)
+            _wakeup.clear()
+            continue
+        try:
+            _run_job(job, worker)
+        except Exception as e:
+            logger.exception(f"Errore job {job['id']}: {e}")
+            _jobs().release(job["id"], worker, QUEUED, delay=CIRCUIT_RESET_SECONDS)
+
+
+def start_workers():
+    """Avvia (una volta per processo) i worker, che riprendono anche i job lasciati a metà"""
+    if _workers:
+        return
+    with _workers_lock:
+        if _workers:
+            return
+        _jobs().purge()
+        for n in range(max(1, JOB_WORKERS)):
+            worker = f"{os.getpid()}-{n}"
+            thread = threading.Thread(target=_worker_loop, args=(worker,), name=f"deep-search-job-{n}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+        logger.info(f"Avviati {len(_workers)} worker della coda ricerche")
+
+
+def submit_job(venues: list, days: list, owner=None, meta: Optional[dict] = None) -> str:
+    """Accoda una ricerca eventi (locali x giorni) da eseguire in background"""
+    start_workers()
+    job_id = _jobs().create(venues, days, owner, meta)
+    _wakeup.set()
+    return job_id
+
+
+def job_status(job_id: str) -> Optional[dict]:
+    return _jobs().job(job_id)
+
+
+def job_results(job_id: str) -> dict:
+    return _jobs().results(job_id)
+
+
+def latest_job(owner) -> Optional[str]:
+    return _jobs().latest(owner)
+
+
+def cancel_job(job_id: str):
+    _jobs().cancel(job_id)
@@ -5,8 +5,8 @@ import math
 import re
 import plotly.express as px
 from datetime import datetime
-from utils.deep_search import check_event_exists
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from utils.search_jobs import ACTIVE, job_status, latest_job, start_workers, submit_job
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -92,39 +92,64 @@ def extract_links(text: str):
     logger.debug(f"Link trovati: {links}")
     return links
 
-def _check_single_venue(row, today):
-    """Helper function per parallelizzare le chiamate API"""
-    logger.debug(f"Controllo evento per: {row.get('des_locale', '')}, {row.get('comune', '')}")
-    result = check_event_exists(row.get("des_locale", ""), row.get("comune", ""), today)
+def _event_row(row, result):
+    """Riga della tabella eventi per un locale, dal risultato della verifica"""
     evidence_meta = result.get("evidence_meta") if isinstance(result, dict) else None
     return {
         "Nome Locale": row.get("des_locale", ""),
-        "Evento Oggi": "✅ Sì" if result.get("exists") else "❌ No",
+        "Evento Oggi": "✅ Sì" if result.get("exists") else (
+            "⚠️ Non verificato" if result.get("circuit_open") else "❌ No"
+        ),
         "Link": ", ".join(
             [f"[{i+1}]({url})" for i, url in enumerate(result.get("evidence", []))]
         ) if result.get("evidence") else "-",
         "EVIDENZE_META": evidence_meta if evidence_meta else None,
     }
 
-def get_today_events(df_top, today):
-    logger.info(f"Recupero eventi per: {today}")
-    table_data = []
-
-    # Parallelizza le chiamate API con max 3 worker per rispettare rate limit 15 RPM
-    # 3 worker con sleep di 4s = ~12-15 richieste al minuto
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        futures = []
-        for _, row in df_top.iterrows():
-            future = executor.submit(_check_single_venue, row, today)
-            futures.append(future)
-
-        # Raccogli i risultati man mano che arrivano
-        for future in as_completed(futures):
-            try:
-                result = future.result()
-                table_data.append(result)
-            except Exception as e:
-                logger.exception(f"Errore durante controllo evento: {e}")
-
-    logger.info(f"Eventi trovati: {len(table_data)}")
-    return pd.DataFrame(table_data)
+def _session_owner():
+    """Sessione Streamlit corrente, per il turno equo sui limiter condivisi della deep search"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+def job_owner():
+    """Utente collegato (o sessione): le sue ricerche in background restano visibili dopo una riconnessione"""
+    return st.session_state.get("user") or _session_owner()
+
+@st.cache_resource
+def start_search_workers():
+    """Avvia una volta per processo i worker delle ricerche, che riprendono i job interrotti"""
+    start_workers()
+    return True
+
+def submit_events_job(df_top, days, meta=None):
+    """
+    Accoda in background la ricerca eventi dei locali di df_top per più giorni (stringhe
+    data, es. "17 ottobre 2026"). Ritorna l'id del job da passare a job_events_by_day.
+    """
+    venues = [
+        {
+            "des_locale": str(row.get("des_locale", "")),
+            "comune": str(row.get("comune", "")),
+            "indirizzo": str(row["indirizzo"]) if pd.notna(row.get("indirizzo")) else "N/A",
+        }
+        for _, row in df_top.iterrows()
+    ]
+    return submit_job(venues, list(days), owner=job_owner(), meta=meta)
+
+def latest_active_events_job():
+    """Ricerca in background ancora in corso dell'utente, se presente"""
+    job_id = latest_job(job_owner())
+    job = job_status(job_id) if job_id else None
+    return job_id if job is not None and job["status"] in ACTIVE else None
+
+def job_events_by_day(job, results):
+    """
+    Eventi verificati finora da un job (job_status, job_results): dict giorno -> DataFrame
+    dei locali con verdetto, nell'ordine dei locali del job.
+    """
+    return {
+        day: pd.DataFrame([
+            _event_row(venue, results[(i, day)]) for i, venue in enumerate(job["venues"]) if (i, day) in results
+        ])
+        for day in job["days"]
+    }
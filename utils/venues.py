@@ -0,0 +1,177 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: nessun lock tra processi
+    fcntl = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+VENUE_MASTER_PATH = os.getenv(
+    "VENUE_MASTER_PATH", os.path.join(os.getenv("DATA_DIR", "/app/data"), "cache", "venues.parquet")
+)
+logger.info(f"VENUE_MASTER_PATH impostato a: {VENUE_MASTER_PATH}")
+
+VENUE_ID_DTYPE = "int32"
+# ID dei locali senza nome (des_locale mancante)
+MISSING_VENUE_ID = -1
+
+
+class VenueMaster:
+    """
+    Anagrafica dei locali: assegna a ogni coppia (sede, des_locale) un identificativo
+    intero stabile, uguale per Locali ed Eventi, così che join, filtri e raggruppamenti
+    delle tab lavorino su colonne intere invece che su stringhe.
+
+    Gli ID coincidono con la posizione nella tabella: i locali nuovi vengono aggiunti in
+    coda e la tabella è salvata su disco (path), quindi gli ID restano gli stessi tra
+    un riavvio e l'altro. Con path=None l'anagrafica resta in memoria.
+
+    Il file può essere condiviso da più processi (repliche sullo stesso DATA_DIR): i nuovi
+    ID vengono assegnati solo sotto un lock sul file (path + ".lock"), dopo aver riletto
+    la tabella su disco, così ogni processo estende la stessa sequenza invece di
+    sovrascrivere quella degli altri.
+    """
+
+    def __init__(self, path: Optional[str] = VENUE_MASTER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sedi = []
+        self._names = []
+        self._ids = {}
+        if path:
+            self._reload()
+            logger.info(f"Anagrafica locali caricata: {len(self._names)} locali")
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @contextmanager
+    def _file_lock(self):
+        """Lock esclusivo tra processi sul file dell'anagrafica"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reload(self):
+        """Aggiunge in coda i locali registrati su disco da altri processi"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            table = pd.read_parquet(self.path).sort_values("venue_id")
+        except Exception as e:
+            logger.warning(f"Errore lettura anagrafica locali {self.path}: {e}")
+            return
+        sedi = table["sede"].astype(str).tolist()
+        names = table["des_locale"].astype(str).tolist()
+        known = len(self._names)
+        if sedi[:known] != self._sedi or names[:known] != self._names:
+            # Il file non estende la sequenza in memoria (sostituito a mano): vale quello su disco
+            logger.error(f"Anagrafica locali {self.path} non coerente con quella in memoria: ricaricata")
+            self._sedi, self._names, known = [], [], 0
+        self._sedi.extend(sedi[known:])
+        self._names.extend(names[known:])
+        self._ids = {key: i for i, key in enumerate(zip(self._sedi, self._names))}
+
+    def _write(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            table = pa.table({
+                "venue_id": pa.array(np.arange(len(self._names), dtype=VENUE_ID_DTYPE)),
+                "sede": pa.array(self._sedi, type=pa.string()),
+                "des_locale": pa.array(self._names, type=pa.string()),
+            })
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Errore scrittura anagrafica locali {self.path}: {e}")
+
+    def _register(self, keys: list):
+        """Assegna gli ID alle coppie nuove e salva (con il lock del file, se su disco)"""
+        new_keys = [k for k in dict.fromkeys(keys) if k is not None and k not in self._ids]
+        for key in new_keys:
+            self._ids[key] = len(self._names)
+            self._sedi.append(key[0])
+            self._names.append(key[1])
+        if new_keys:
+            logger.info(f"Anagrafica locali: {len(new_keys)} nuovi locali, totale {len(self._names)}")
+            if self.path:
+                self._write()
+
+    def ids(self, sede: pd.Series, des_locale: pd.Series) -> np.ndarray:
+        """
+        ID dei locali per le coppie (sede, des_locale) riga per riga, registrando quelle nuove.
+        Le stringhe vengono confrontate una sola volta per coppia distinta (interning):
+        per colonne categoriche il lavoro è proporzionale alle categorie, non alle righe.
+        """
+        sede_codes, sede_values = pd.factorize(sede)
+        name_codes, name_values = pd.factorize(des_locale)
+        if not len(sede_codes):
+            return np.empty(0, dtype=VENUE_ID_DTYPE)
+
+        # Codici spostati di uno: -1 (valore mancante) diventa 0
+        stride = len(name_values) + 1
+        pair = (sede_codes.astype(np.int64) + 1) * stride + name_codes + 1
+        unique_pairs, inverse = np.unique(pair, return_inverse=True)
+        pair_sede, pair_name = np.divmod(unique_pairs, stride)
+        pair_sede, pair_name = pair_sede - 1, pair_name - 1
+
+        keys = [
+            (str(sede_values[s]), str(name_values[n])) if s >= 0 and n >= 0 else None
+            for s, n in zip(pair_sede, pair_name)
+        ]
+        with self._lock:
+            if any(k is not None and k not in self._ids for k in keys):
+                if self.path:
+                    with self._file_lock():
+                        self._reload()
+                        self._register(keys)
+                else:
+                    self._register(keys)
+            pair_ids = np.array(
+                [self._ids[k] if k is not None else MISSING_VENUE_ID for k in keys], dtype=VENUE_ID_DTYPE
+            )
+        return pair_ids[inverse]
+
+    def names(self, venue_ids: Iterable[int]) -> list:
+        """Nomi (des_locale) dei locali indicati"""
+        return [self._names[i] if 0 <= i < len(self._names) else "" for i in venue_ids]
+
+    def name(self, venue_id: int) -> str:
+        return self.names([venue_id])[0]
+
+
+@st.cache_resource
+def get_venue_master() -> VenueMaster:
+    """Anagrafica unica dei locali per l'intero processo"""
+    return VenueMaster()
+
+
+def assign_venue_ids(df: pd.DataFrame, sede_column: str = "sede",
+                     master: Optional[VenueMaster] = None) -> pd.DataFrame:
+    """Aggiunge a df la colonna venue_id, dalle colonne sede_column e des_locale"""
+    if df.empty or sede_column not in df.columns or "des_locale" not in df.columns:
+        return df
+    master = master if master is not None else get_venue_master()
+    return df.assign(venue_id=master.ids(df[sede_column], df["des_locale"]))